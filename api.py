@@ -0,0 +1,76 @@
+import datetime
+import json
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#----------------------------------------------------------------------------#
+# JSON API helpers.
+#----------------------------------------------------------------------------#
+
+# The /api/v1 routes in app.py return the same page data the HTML views
+# render, encoded here. SQLAlchemy rows and the VenueShow/ArtistShow
+# tuples from queries.py are written as objects, datetimes as ISO 8601.
+# orjson is used when it is installed and the standard library otherwise;
+# both produce the same documents.
+#
+# ?fields=id,name keeps only those keys of each record in the response.
+
+PREFIX = '/api/'
+
+
+def _default(value):
+    if hasattr(value, '_asdict'):
+        return value._asdict()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def _plain(value):
+    # The json module writes namedtuples as arrays without asking
+    # _default, so they are converted up front.
+    if hasattr(value, '_asdict'):
+        value = value._asdict()
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(_plain(data), default=_default, separators=(',', ':'))
+
+
+def fields_arg():
+    # The requested sparse fieldset, or None for every field.
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+def sparse(record, fields):
+    if fields is None:
+        return record
+    mapping = record._asdict() if hasattr(record, '_asdict') else record
+    return {field: mapping[field] for field in fields if field in mapping}
+
+
+def is_api_request():
+    return request.path.startswith(PREFIX)
+
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def error_response(error):
+    # JSON body for an HTTPException raised under /api/.
+    return json_response({'error': {'code': error.code, 'message': error.description}}, error.code)
@@ -3,16 +3,40 @@
 #----------------------------------------------------------------------------#
 
 import json
+import hmac
+import sys
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import click
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, stream_with_context
 from flask_moment import Moment
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 import datetime
-from models import dbConnect, Venue, Artist, Show
+from models import dbConnect, Venue, Artist, Show, touch
+import bookings
+import counters
+import directory
+import search as search_index
+from pagination import page_args, encode_cursor, decode_cursor
+import queries
+from cache import Cache
+from replicas import ReplicaRouter
+from jobs import JobQueue, logger as jobs_logger
+from typeahead import TypeaheadIndex
+from facets import FacetIndex, FACETS
+from matchmaking import MatchIndex
+from assets import Assets, build as build_assets
+from images import ImageProxy
+from conditional import conditional, current_watermark
+from filters import make_datetime_filter
+from sqlprofiler import QueryProfiler, logger as sql_logger
+from seed import seed_command
+import importer
+import exporter
+import explain
+import api
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -20,6 +44,17 @@ from models import dbConnect, Venue, Artist, Show
 app = Flask(__name__)
 moment = Moment(app)
 db = dbConnect(app)
+replicas = ReplicaRouter(app)
+cache = Cache.from_config(app.config)
+cache.bypass = replicas.pinned
+cache.version = current_watermark
+profiler = QueryProfiler(app)
+typeahead = TypeaheadIndex.from_config(app.config)
+facet_indexes = {kind: FacetIndex.from_config(kind, app.config) for kind in ('venue', 'artist')}
+match_indexes = {kind: MatchIndex.from_config(kind, app.config) for kind in ('venue', 'artist')}
+assets = Assets(app)
+images = ImageProxy(app)
+jobs = JobQueue(app)
 
 # TODO: connect to a local postgresql database
 
@@ -28,17 +63,193 @@ db = dbConnect(app)
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+format_datetime = make_datetime_filter(
+  app.config.get('DISPLAY_TIMEZONE'),
+  app.config.get('STORAGE_TIMEZONE', 'UTC'),
+  app.config.get('DATETIME_FILTER_CACHE_SIZE', 4096)
+)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+#----------------------------------------------------------------------------#
+# Page data.
+#----------------------------------------------------------------------------#
+
+# What the GET views render, built through queries.py and cached. Listing
+# pages are tagged with their listing only and detail pages with their own
+# venue or artist. The write handlers below invalidate through the
+# *_changed functions, which also reach the pages of the venues or artists
+# sharing a show with the one written, since those pages show its name.
+
+def venue_tags(ids):
+  return ['venue:{}'.format(venue_id) for venue_id in ids]
+
+def artist_tags(ids):
+  return ['artist:{}'.format(artist_id) for artist_id in ids]
+
+def venue_directory_data(cursor, limit):
+  # One row per area, already grouped by directory.py.
+  def build():
+    rows, next_cursor = queries.venue_directory(cursor, limit)
+    areas = [{
+      "city": row.city,
+      "state": row.state,
+      "venues": row.venues
+    } for row in rows]
+    return areas, next_cursor
+
+  return cache.get_or_set('venues:{}:{}'.format(cursor, limit), build, tags=['venues'])
+
+def artist_listing_data(cursor, limit):
+  return cache.get_or_set('artists:{}:{}'.format(cursor, limit),
+    lambda: queries.artist_listing(cursor, limit), tags=['artists'])
+
+def show_listing_data(cursor, limit):
+  return cache.get_or_set('shows:{}:{}'.format(cursor, limit),
+    lambda: queries.show_listing(cursor, limit), tags=['shows'])
+
+def venue_page_data(venue_id):
+  # The past/upcoming split moves with the clock; CACHE_DEFAULT_TTL bounds
+  # how long a page can lag behind a show starting.
+  def build():
+    return queries.venue_page(venue_id, datetime.datetime.now(), app.config.get('PAST_SHOWS_LIMIT'))
+
+  return cache.get_or_set('venue:{}'.format(venue_id), build, tags=venue_tags([venue_id]))
+
+def artist_page_data(artist_id):
+  def build():
+    return queries.artist_page(artist_id, datetime.datetime.now(), app.config.get('PAST_SHOWS_LIMIT'))
+
+  return cache.get_or_set('artist:{}'.format(artist_id), build, tags=artist_tags([artist_id]))
+
+def search_data(search, term, offset):
+  # Search results are not cached: terms rarely repeat and the counters
+  # they show change with every new show.
+  count, rows = search(term, offset=offset)
+  results = [{
+    "id": row.id,
+    "name": row.name,
+    "num_upcoming_shows": row.num_upcoming_shows
+  } for row in rows]
+  return {
+    "count": count,
+    "data": results,
+    "next_offset": offset + len(results) if offset + len(results) < count else None
+  }
+
+def facet_args():
+  # The {facet: [values]} chosen in the query string, e.g.
+  # ?genre=Jazz&genre=Blues&state=TX&seeking=yes. Unknown values are ignored.
+  selected = {facet: [value for value in request.args.getlist(facet) if value in values]
+    for facet, values in FACETS.items()}
+  return {facet: values for facet, values in selected.items() if values}
+
+def facet_links(counts, selected, endpoint):
+  # Sidebar groups: every value with a count or already chosen, linking to
+  # the same page with that value toggled.
+  groups = []
+  for facet, values in counts.items():
+    links = []
+    for value, count in values.items():
+      chosen = value in selected.get(facet, ())
+      if not count and not chosen:
+        continue
+      toggled = dict(selected)
+      toggled[facet] = [other for other in selected.get(facet, []) if other != value] if chosen else \
+        selected.get(facet, []) + [value]
+      links.append({"value": value, "count": count, "selected": chosen, "url": url_for(endpoint, **toggled)})
+    groups.append({"facet": facet, "values": links})
+  return groups
+
+def facet_counts(kind):
+  # Counts for the unfiltered directory pages.
+  index = facet_indexes[kind]
+  index.refresh_in_background(app)
+  return index.search({}, limit=0)[2]
+
+def browse_data(kind, selected, cursor, limit):
+  # Venues or artists matching the selection, newest first, with live
+  # counts from the in-memory facet index. Not cached: the index answers
+  # in well under a millisecond and only the page's names are read from
+  # the database. The cursor holds the last id shown.
+  index = facet_indexes[kind]
+  index.refresh_in_background(app)
+  try:
+    before = int(decode_cursor(cursor, 1)[0]) if cursor else None
+  except (ValueError, TypeError, KeyError):
+    abort(400)
+  total, ids, counts = index.search(selected, before, limit + 1)
+  model = Venue if kind == 'venue' else Artist
+  rows = queries.rows_by_id(model, ids[:limit])
+  return {
+    "count": total,
+    "data": [{"id": row.id, "name": row.name, "city": row.city, "state": row.state} for row in rows],
+    "facets": counts,
+    "next_cursor": encode_cursor([ids[limit - 1]]) if len(ids) > limit else None
+  }
+
+def venue_changed(venue_id, listing=True, artist_ids=None):
+  # Called after a venue write has been committed. artist_ids are the
+  # artists with a show there, looked up when not given (a delete has to
+  # collect them before its shows go).
+  if artist_ids is None:
+    artist_ids = queries.venue_artist_ids(venue_id)
+  cache.invalidate('shows', *venue_tags([venue_id]) + artist_tags(artist_ids) +
+    (['venues'] if listing else []))
+
+def artist_changed(artist_id, listing=True, venue_ids=None):
+  # Called after an artist write has been committed; like venue_changed.
+  if venue_ids is None:
+    venue_ids = queries.artist_venue_ids(artist_id)
+  cache.invalidate('shows', *artist_tags([artist_id]) + venue_tags(venue_ids) +
+    (['artists'] if listing else []))
+
+def show_changed(venue_id, artist_id):
+  # Called after a show has been committed. The venue and artist pages and
+  # the venue's upcoming count in the directory change with it.
+  cache.invalidate('shows', 'venues', *venue_tags([venue_id]) + artist_tags([artist_id]))
+
+def imported(kind, rows):
+  # Called after each committed bulk import batch.
+  if kind == 'shows':
+    cache.invalidate('shows', 'venues', *venue_tags({row['venue_id'] for row in rows}) +
+      artist_tags({row['artist_id'] for row in rows}))
+    for index in match_indexes.values():
+      index.request_rebuild()
+  else:
+    cache.invalidate(kind)
+    # Bulk inserts do not return ids; have every process reload names,
+    # facets and match features.
+    typeahead.request_rebuild()
+    facet_indexes['venue' if kind == 'venues' else 'artist'].request_rebuild()
+    match_indexes['venue' if kind == 'venues' else 'artist'].request_rebuild()
+
+def image_changed(kind, entity_id, link):
+  # Called before a write that sets image_link is committed.
+  if link:
+    jobs.defer('warm-images', kind, entity_id, key='{}:{}'.format(kind, entity_id))
+
+@app.before_first_request
+def load_indexes():
+  for index in (typeahead, *facet_indexes.values(), *match_indexes.values()):
+    index.load()
+
+
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# Follow-on work the write handlers queue for `flask worker`; see jobs.py.
+# Cache invalidation and typeahead updates stay in the handlers, since
+# they act on the web process's own memory.
+
+@jobs.task('warm-images')
+def warm_images(kind, entity_id):
+  # The worker must share IMAGE_CACHE_DIR with the web processes.
+  images.warm(kind, entity_id)
+
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -52,34 +263,25 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional(lambda: (queries.table_watermark('Venue', 'Show'),))
 def venues():
   # TODO: replace with real venues data.
   # num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
 
-  today = datetime.datetime.now()
-  venue_areas = db.session.query(Venue.city,Venue.state).group_by(Venue.state, Venue.city).all()
-  data = []
-  
-  for area in venue_areas:
-    venues = Venue.query.filter(Venue.city==area.city, Venue.state==area.state).all()
-
-    venue_details = []
+  cursor, limit = page_args()
+  selected = facet_args()
+  if selected:
+    results = browse_data('venue', selected, cursor, limit)
+    return render_template('pages/browse.html', kind='venue', results=results,
+      facets=facet_links(results['facets'], selected, 'venues'),
+      first_url=url_for('venues', limit=limit, **selected),
+      next_url=url_for('venues', cursor=results['next_cursor'], limit=limit, **selected) if results['next_cursor'] else None)
 
-    for venue in venues:
-      upcoming_shows_count = len(db.session.query(Show).join(Venue).filter(Show.venue_id==venue.id).filter(Show.start_time>today).all()) 
-      venue_details.append({
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows":upcoming_shows_count
-      })
+  data, next_cursor = venue_directory_data(cursor, limit)
 
-      data.append({
-        "city": area.city,
-        "state": area.state,
-        "venues": venue_details
-      })
-
-  return render_template('pages/venues.html', areas=data)
+  return render_template('pages/venues.html', areas=data,
+    kind='venue', facets=facet_links(facet_counts('venue'), {}, 'venues'),
+    next_url=url_for('venues', cursor=next_cursor, limit=limit) if next_cursor else None)
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
@@ -87,73 +289,19 @@ def search_venues():
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
 
-  today = datetime.datetime.now()
-  query = request.form['search_term']
-  search = Venue.query.filter(Venue.name.ilike('%' + format(query) + '%')).all()
-
-  results = []
-  for venue in search:
-    upcoming_shows_count = len(db.session.query(Show).join(Venue).filter(Show.venue_id==venue.id).filter(Show.start_time>today).all()) #To count the upcoming shows and display real value in the template
-    results.append({
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": upcoming_shows_count     
-    })
+  offset = request.form.get('offset', 0, type=int)
+  response = search_data(search_index.search_venues, request.form['search_term'], offset)
 
-  response={
-    "count": len(search),
-    "data": results
-    }
-
-  
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
+@conditional(lambda venue_id: queries.venue_watermark(venue_id, datetime.datetime.now()))
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
-  venue = Venue.query.get(venue_id)
-  today = datetime.datetime.now()
-
-  past_shows_query = db.session.query(Show).join(Artist).filter(Show.venue_id==venue_id).filter(Show.start_time<today).all()
-  past_shows = []
-  for show in past_shows_query:
-    past_shows.append({
-      "artist_id": show.artist_id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": str(show.start_time)
-    })
-
-
-  upcoming_shows_query = db.session.query(Show).join(Artist).filter(Show.venue_id==venue_id).filter(Show.start_time>today).all()
-  upcoming_shows = []
-  for show in upcoming_shows_query:
-    upcoming_shows.append({
-        "artist_id": show.artist_id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": str(show.start_time)
-      })
-
-  data={
-    "id": venue.id,
-    "name": venue.name,
-    "genres": venue.genres,
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows)
-  }
+  data = venue_page_data(venue_id)
+  if data is None:
+    abort(404)
   # data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
   return render_template('pages/show_venue.html', venue=data)
 
@@ -186,7 +334,14 @@ def create_venue_submission():
     )
 
     db.session.add(venue)
+    db.session.flush()
+    directory.refresh_areas([(venue.state, venue.city)])
+    image_changed('venue', venue.id, venue.image_link)
     db.session.commit()
+    venue_changed(venue.id)
+    typeahead.put('venue', venue.id, venue.name)
+    facet_indexes['venue'].put(venue.id, venue.genres, venue.state, venue.seeking_talent)
+    match_indexes['venue'].put(venue.id, venue.genres, venue.city, venue.state, venue.seeking_talent)
     # on successful db insert, flash success
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
   except:
@@ -201,29 +356,49 @@ def create_venue_submission():
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
-  return None
+  try:
+    venue = Venue.query.get(venue_id)
+    name = venue.name
+    artist_ids = queries.venue_artist_ids(venue.id)
+    counters.forget_venue(venue.id)
+    db.session.delete(venue)
+    directory.refresh_areas([(venue.state, venue.city)])
+    db.session.commit()
+    venue_changed(int(venue_id), artist_ids=artist_ids)
+    typeahead.discard('venue', int(venue_id))
+    facet_indexes['venue'].discard(int(venue_id))
+    match_indexes['venue'].discard(int(venue_id))
+    flash('Venue ' + name + ' was successfully deleted!')
+  except:
+    db.session.rollback()
+    flash('An error occurred. Venue could not be deleted.')
+  finally:
+    db.session.close()
+
+  return redirect(url_for('index'))
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@conditional(lambda: (queries.table_watermark('Artist'),))
 def artists():
   # TODO: replace with real data returned from querying the database
-  data= []
-  artists = Artist.query.all()
+  cursor, limit = page_args()
+  selected = facet_args()
+  if selected:
+    results = browse_data('artist', selected, cursor, limit)
+    return render_template('pages/browse.html', kind='artist', results=results,
+      facets=facet_links(results['facets'], selected, 'artists'),
+      first_url=url_for('artists', limit=limit, **selected),
+      next_url=url_for('artists', cursor=results['next_cursor'], limit=limit, **selected) if results['next_cursor'] else None)
 
-  for artist in artists:
-    result =({
-      'id':artist.id,
-      'name':artist.name
-    })
-    data.append(result)
+  data, next_cursor = artist_listing_data(cursor, limit)
 
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=data,
+    kind='artist', facets=facet_links(facet_counts('artist'), {}, 'artists'),
+    next_url=url_for('artists', cursor=next_cursor, limit=limit) if next_cursor else None)
 
 
 @app.route('/artists/search', methods=['POST'])
@@ -232,70 +407,19 @@ def search_artists():
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
 
-  today = datetime.datetime.now()
-  query = request.form['search_term']
-  search = Artist.query.filter(Artist.name.ilike('%' + format(query) + '%')).all()
-  results = []
-
-  for artist in search:
-    upcoming_shows_count = len(db.session.query(Show).join(Venue).filter(Show.artist_id==artist.id).filter(Show.start_time>today).all()) #To count the upcoming shows and display real value in the template
-    results.append({
-        "id": artist.id,
-        "name": artist.name,
-        "num_upcoming_shows": upcoming_shows_count     
-    })
-
-  response={
-    "count": len(search),
-    "data": results
-  }
+  offset = request.form.get('offset', 0, type=int)
+  response = search_data(search_index.search_artists, request.form['search_term'], offset)
 
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@conditional(lambda artist_id: queries.artist_watermark(artist_id, datetime.datetime.now()))
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
   # TODO: replace with real artist data from the artist table, using artist_id
-  artist = db.session.query(Artist).get(artist_id)
-  today = datetime.datetime.now()
-
-  past_shows_query = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time<today).all()
-  past_shows = []
-  for show in past_shows_query:
-    past_shows.append({
-      "venue_id": show.venue_id,
-      "venue_name": show.venue.name,
-      "venue_image_link": show.venue.image_link,
-      "start_time": str(show.start_time)
-    })
-
-  upcoming_shows_query = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time>today).all()
-  upcoming_shows = []
-  for show in upcoming_shows_query:
-    upcoming_shows.append({
-        "venue_id": show.venue_id,
-        "venue_name": show.venue.name,
-        "venue_image_link": show.venue.image_link,
-        "start_time": str(show.start_time)
-      })
-      
-  data = {
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres, 
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description":artist.seeking_description,
-    "image_link": artist.image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows)
-  }
+  data = artist_page_data(artist_id)
+  if data is None:
+    abort(404)
   # data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
   return render_template('pages/show_artist.html', artist=data)
 
@@ -338,7 +462,12 @@ def edit_artist_submission(artist_id):
     artist.seeking_venue = request.form.get('seeking_venue', type=bool)
     artist.seeking_description = request.form['seeking_description']
 
+    image_changed('artist', artist_id, artist.image_link)
     db.session.commit()
+    artist_changed(artist_id)
+    typeahead.put('artist', artist_id, artist.name)
+    facet_indexes['artist'].put(artist_id, artist.genres, artist.state, artist.seeking_venue)
+    match_indexes['artist'].put(artist_id, artist.genres, artist.city, artist.state, artist.seeking_venue)
     flash("Artist {} is updated successfully".format(artist.name))
   except:
     db.session.rollback()
@@ -374,6 +503,7 @@ def edit_venue_submission(venue_id):
 
   try:
     venue = Venue.query.get(venue_id)
+    area = (venue.state, venue.city)
     venue.name = request.form['name']
     venue.city = request.form['city']
     venue.state = request.form['state']
@@ -382,10 +512,16 @@ def edit_venue_submission(venue_id):
     venue.genres = request.form.getlist('genres')
     venue.image_link = request.form['image_link']
     venue.website = request.form['website_link']
-    venue.seeking_venue = request.form.get('seeking_venue', type=bool)
+    venue.seeking_talent = request.form.get('seeking_talent', type=bool)
     venue.seeking_description = request.form['seeking_description']
 
+    directory.refresh_areas([area, (venue.state, venue.city)])
+    image_changed('venue', venue_id, venue.image_link)
     db.session.commit()
+    venue_changed(venue_id)
+    typeahead.put('venue', venue_id, venue.name)
+    facet_indexes['venue'].put(venue_id, venue.genres, venue.state, venue.seeking_talent)
+    match_indexes['venue'].put(venue_id, venue.genres, venue.city, venue.state, venue.seeking_talent)
     flash("Venue {} is updated successfully".format(venue.name))
   except:
     db.session.rollback()
@@ -425,7 +561,13 @@ def create_artist_submission():
     )
 
     db.session.add(artist)
+    db.session.flush()
+    image_changed('artist', artist.id, artist.image_link)
     db.session.commit()
+    artist_changed(artist.id)
+    typeahead.put('artist', artist.id, artist.name)
+    facet_indexes['artist'].put(artist.id, artist.genres, artist.state, artist.seeking_venue)
+    match_indexes['artist'].put(artist.id, artist.genres, artist.city, artist.state, artist.seeking_venue)
     # on successful db insert, flash success
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
   except:
@@ -442,24 +584,16 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@conditional(lambda: (queries.table_watermark('Show', 'Venue', 'Artist'),))
 def shows():
   # displays list of shows at /shows
   # TODO: replace with real venues data.
 
-  shows = Show.query.all()
-  data = []
-  
-  for show in shows:
-    data.append({
-      "venue_id": show.venue_id,
-      "venue_name": show.venue.name,
-      "artist_id": show.artist_id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": str(show.start_time)
-      })
-
-  return render_template('pages/shows.html', shows=data)
+  cursor, limit = page_args()
+  data, next_cursor = show_listing_data(cursor, limit)
+
+  return render_template('pages/shows.html', shows=data,
+    next_url=url_for('shows', cursor=next_cursor, limit=limit) if next_cursor else None)
 
 @app.route('/shows/create')
 def create_shows():
@@ -473,12 +607,23 @@ def create_show_submission():
   # TODO: insert form data as a new Show record in the db, instead
   try:
     show = Show()
-    show.venue_id=request.form['venue_id'],
-    show.artist_id=request.form['artist_id'],
-    show.start_time=request.form['start_time'],
-      
+    show.venue_id=int(request.form['venue_id'])
+    show.artist_id=int(request.form['artist_id'])
+    show.start_time=dateutil.parser.parse(request.form['start_time'])
+    show.end_time=show.start_time + bookings.parse_duration(request.form.get('duration'))
+
+    clashes = bookings.conflicts(show.venue_id, show.artist_id, show.start_time, show.end_time)
+    if clashes:
+      flash('Show could not be listed. ' + ' '.join(clashes))
+      return render_template('pages/home.html')
+
     db.session.add(show)
+    counters.record_show(show)
+    directory.refresh_venues([show.venue_id])
     db.session.commit()
+    show_changed(show.venue_id, show.artist_id)
+    match_indexes['venue'].add_show(show.venue_id)
+    match_indexes['artist'].add_show(show.artist_id)
     # on successful db insert, flash success
     flash('Show was successfully listed!')
 
@@ -494,25 +639,403 @@ def create_show_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   return render_template('pages/home.html')
 
+#  API
+#  ----------------------------------------------------------------
+
+# JSON versions of the read pages, built from the same page data and
+# validated by the same watermarks as the HTML views; see api.py.
+
+def api_page(records, next_cursor, endpoint, limit, **args):
+  # args are the query string arguments the next page needs besides the
+  # cursor, limit and fields.
+  fields = api.fields_arg()
+  return api.json_response({
+    "data": [api.sparse(record, fields) for record in records],
+    "next": url_for(endpoint, cursor=next_cursor, limit=limit, fields=request.args.get('fields'), **args) if next_cursor else None
+  })
+
+def api_detail(data):
+  if data is None:
+    abort(404)
+  return api.json_response({"data": api.sparse(data, api.fields_arg())})
+
+def api_search(search):
+  term = request.args.get('search_term', '')
+  response = search_data(search, term, request.args.get('offset', 0, type=int))
+  fields = api.fields_arg()
+  response['data'] = [api.sparse(record, fields) for record in response['data']]
+  return api.json_response(response)
+
+@app.route('/api/v1/venues')
+@conditional(lambda: (queries.table_watermark('Venue', 'Show'),))
+def api_venues():
+  # Grouped by area like /venues; fields apply to the venues in each area.
+  cursor, limit = page_args()
+  areas, next_cursor = venue_directory_data(cursor, limit)
+  fields = api.fields_arg()
+  return api.json_response({
+    "data": [dict(area, venues=[api.sparse(venue, fields) for venue in area['venues']]) for area in areas],
+    "next": url_for('api_venues', cursor=next_cursor, limit=limit, fields=request.args.get('fields')) if next_cursor else None
+  })
+
+@app.route('/api/v1/venues/available')
+@conditional(lambda: (queries.table_watermark('Venue', 'Show'),))
+def api_available_venues():
+  # Venues with nothing booked between ?start= and ?end=, narrowed by
+  # ?city=, ?state= and ?genres= (comma separated, all required), e.g.
+  # /api/v1/venues/available?start=2026-10-23T20:00&end=2026-10-23T23:00&city=Austin&state=TX&genres=Jazz
+  try:
+    start = dateutil.parser.parse(request.args['start'])
+    end = dateutil.parser.parse(request.args['end'])
+  except (KeyError, ValueError, OverflowError):
+    abort(400, 'start and end must both be given as dates and times.')
+  if end <= start:
+    abort(400, 'end must be after start.')
+  filters = {name: request.args.get(name) or None for name in ('city', 'state', 'genres')}
+  genres = [genre.strip() for genre in (filters['genres'] or '').split(',') if genre.strip()]
+  cursor, limit = page_args()
+  rows, next_cursor = queries.available_venues(start, end, filters['city'], filters['state'], genres, cursor, limit)
+  return api_page(rows, next_cursor, 'api_available_venues', limit,
+    start=request.args['start'], end=request.args['end'], **filters)
+
+def api_facets(kind, endpoint):
+  # The browse pages as JSON: count, facet counts and a page of matches.
+  selected = facet_args()
+  cursor, limit = page_args()
+  results = browse_data(kind, selected, cursor, limit)
+  fields = api.fields_arg()
+  return api.json_response({
+    "count": results['count'],
+    "facets": results['facets'],
+    "data": [api.sparse(record, fields) for record in results['data']],
+    "next": url_for(endpoint, cursor=results['next_cursor'], limit=limit, fields=request.args.get('fields'),
+      **selected) if results['next_cursor'] else None
+  })
+
+@app.route('/api/v1/venues/facets')
+@conditional(lambda: (queries.table_watermark('Venue'),))
+def api_venue_facets():
+  # e.g. /api/v1/venues/facets?genre=Jazz&genre=Blues&state=TX&seeking=yes
+  return api_facets('venue', 'api_venue_facets')
+
+def api_matches(model, entity_id, kind):
+  # The best `kind` candidates for the venue or artist entity_id; see
+  # matchmaking.py. ?seeking=yes leaves out candidates not seeking.
+  asker = queries.match_profile(model, entity_id)
+  if asker is None:
+    abort(404)
+  index = match_indexes[kind]
+  index.refresh_in_background(app)
+  matches = index.top(asker.genres, asker.city, asker.state, request.args.get('limit', type=int),
+    seeking_only=request.args.get('seeking') == 'yes')
+  rows = queries.rows_by_id(Venue if kind == 'venue' else Artist, [entity_id for entity_id, _ in matches])
+  scores = dict(matches)
+  fields = api.fields_arg()
+  return api.json_response({
+    "data": [api.sparse({"id": row.id, "name": row.name, "city": row.city, "state": row.state,
+                         "score": scores[row.id]}, fields) for row in rows]
+  })
+
+@app.route('/api/v1/venues/<int:venue_id>/matches')
+@conditional(lambda venue_id: (queries.table_watermark('Venue', 'Artist', 'Show'),))
+def api_venue_matches(venue_id):
+  # Artists for the venue, e.g. /api/v1/venues/1/matches?limit=20&seeking=yes
+  return api_matches(Venue, venue_id, 'artist')
+
+@app.route('/api/v1/venues/search')
+def api_search_venues():
+  return api_search(search_index.search_venues)
+
+@app.route('/api/v1/venues/<int:venue_id>')
+@conditional(lambda venue_id: queries.venue_watermark(venue_id, datetime.datetime.now()))
+def api_venue(venue_id):
+  return api_detail(venue_page_data(venue_id))
+
+@app.route('/api/v1/artists')
+@conditional(lambda: (queries.table_watermark('Artist'),))
+def api_artists():
+  cursor, limit = page_args()
+  return api_page(*artist_listing_data(cursor, limit), 'api_artists', limit)
+
+@app.route('/api/v1/artists/facets')
+@conditional(lambda: (queries.table_watermark('Artist'),))
+def api_artist_facets():
+  return api_facets('artist', 'api_artist_facets')
+
+@app.route('/api/v1/artists/<int:artist_id>/matches')
+@conditional(lambda artist_id: (queries.table_watermark('Venue', 'Artist', 'Show'),))
+def api_artist_matches(artist_id):
+  # Venues for the artist.
+  return api_matches(Artist, artist_id, 'venue')
+
+@app.route('/api/v1/artists/search')
+def api_search_artists():
+  return api_search(search_index.search_artists)
+
+@app.route('/api/v1/artists/<int:artist_id>')
+@conditional(lambda artist_id: queries.artist_watermark(artist_id, datetime.datetime.now()))
+def api_artist(artist_id):
+  return api_detail(artist_page_data(artist_id))
+
+@app.route('/api/v1/typeahead')
+def api_typeahead():
+  # Name matches for search as you type, answered from memory; see
+  # typeahead.py. ?type=venue or ?type=artist narrows the results.
+  typeahead.refresh_in_background(app)
+  kind = request.args.get('type')
+  matches = typeahead.query(request.args.get('q', ''), request.args.get('limit', type=int),
+    kinds=[kind] if kind else None)
+  fields = api.fields_arg()
+  return api.json_response({
+    "data": [api.sparse({"type": kind, "id": entity_id, "name": name}, fields)
+             for kind, entity_id, name in matches]
+  })
+
+@app.route('/api/v1/shows')
+@conditional(lambda: (queries.table_watermark('Show', 'Venue', 'Artist'),))
+def api_shows():
+  cursor, limit = page_args()
+  return api_page(*show_listing_data(cursor, limit), 'api_shows', limit)
+
+#  Import
+#  ----------------------------------------------------------------
+
+IMPORT_TYPES = {
+  'text/csv': 'csv',
+  'application/x-ndjson': 'ndjson',
+  'application/jsonl': 'ndjson',
+}
+
+def require_token():
+  # The import and /_stats endpoints need "Authorization: Bearer
+  # <IMPORT_TOKEN>". Without a token configured they do not exist.
+  token = app.config.get('IMPORT_TOKEN')
+  if not token:
+    abort(404)
+  if not hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token):
+    abort(401)
+
+@app.route('/import/<kind>', methods=['POST'])
+def import_records(kind):
+  # Bulk import for venues, artists or shows; see importer.py. The body is
+  # the file itself, read as it arrives; see require_token for access.
+  if kind not in importer.KINDS:
+    abort(404)
+  require_token()
+  format = IMPORT_TYPES.get(request.mimetype)
+  if format is None:
+    abort(415)
+
+  limit = app.config.get('IMPORT_MAX_REPORTED_REJECTS', 100)
+  rejects = []
+
+  def on_reject(line, errors):
+    if len(rejects) < limit:
+      rejects.append({'line': line, 'errors': errors})
+
+  try:
+    inserted, rejected = importer.run_import(kind,
+      importer.read_rows(importer.text_stream(request.stream), format),
+      app.config.get('IMPORT_BATCH_SIZE', importer.DEFAULT_BATCH_SIZE), on_reject, imported)
+  except:
+    db.session.rollback()
+    raise
+  finally:
+    db.session.close()
+
+  return jsonify(inserted=inserted, rejected=rejected, rejects=rejects)
+
+#  Export
+#  ----------------------------------------------------------------
+
+EXPORT_TYPES = {
+  'ndjson': 'application/x-ndjson',
+  'csv': 'text/csv',
+}
+
+@app.route('/export/<kind>.<format>')
+def export_records(kind, format):
+  # Streams every matching venue, artist or show; see exporter.py for the
+  # filters. Compressed with gzip when the client accepts it.
+  if kind not in importer.KINDS or format not in exporter.FORMATS:
+    abort(404)
+  filters = {name: request.args.get(name) or None for name in ('city', 'state')}
+  try:
+    for name in ('start', 'end'):
+      value = request.args.get(name)
+      filters[name] = dateutil.parser.parse(value) if value else None
+  except (ValueError, OverflowError):
+    abort(400)
+
+  chunks = exporter.rows(kind, format, app.config.get('EXPORT_YIELD_PER', exporter.YIELD_PER), **filters)
+  headers = {'Content-Disposition': 'attachment; filename={}.{}'.format(kind, format)}
+  if 'gzip' in request.accept_encodings:
+    chunks = exporter.gzipped(chunks)
+    headers['Content-Encoding'] = 'gzip'
+  headers['Vary'] = 'Accept-Encoding'
+  return Response(stream_with_context(chunks), mimetype=EXPORT_TYPES[format], headers=headers)
+
+#  Maintenance
+#  ----------------------------------------------------------------
+
+@app.cli.command('rollover-shows')
+def rollover_shows_command():
+  """Move shows that have started from upcoming to past counters.
+
+  Meant to run periodically, e.g. every few minutes from cron.
+  """
+  now = datetime.datetime.now()
+  areas = directory.started_areas(now)
+  rolled = counters.rollover(now)
+  directory.refresh_areas(areas)
+  db.session.commit()
+  if rolled:
+    cache.invalidate('venues')
+  print('Rolled over {} shows'.format(rolled))
+
+@app.cli.command('recount-shows')
+def recount_shows_command():
+  """Rebuild the venue and artist show counters from the Show table."""
+  counters.recount()
+  directory.rebuild()
+  db.session.commit()
+  print('Show counters rebuilt')
+
+@app.cli.command('refresh-venue-directory')
+def refresh_venue_directory_command():
+  """Rebuild every row of the /venues directory from the Venue table."""
+  directory.rebuild()
+  # The rows are written with plain inserts, which the flush hook does not
+  # see; bump the watermark /venues is validated against by hand.
+  touch(db.session, 'Venue')
+  db.session.commit()
+  cache.invalidate('venues')
+  print('Venue directory rebuilt')
+
+app.cli.add_command(seed_command)
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(importer.KINDS)))
+@click.argument('source', type=click.File('rb'))
+@click.option('--format', type=click.Choice(importer.FORMATS), help='Defaults to csv for *.csv files, else ndjson.')
+@click.option('--batch-size', default=importer.DEFAULT_BATCH_SIZE, show_default=True)
+def import_command(kind, source, format, batch_size):
+  """Import venues, artists or shows from a CSV or NDJSON file ('-' for stdin).
+
+  Rejected rows are reported on stderr with their line number.
+  """
+  def on_reject(line, errors):
+    click.echo('line {}: {}'.format(line, importer.format_errors(errors)), err=True)
+
+  format = format or importer.guess_format(source.name)
+  inserted, rejected = importer.run_import(kind,
+    importer.read_rows(importer.text_stream(source), format), batch_size, on_reject, imported)
+  print('Imported {} {}, rejected {}'.format(inserted, kind, rejected))
+  if rejected:
+    sys.exit(1)
+
+@app.cli.command('rebuild-typeahead')
+def rebuild_typeahead_command():
+  """Reload the typeahead index in every running process."""
+  typeahead.build()
+  typeahead.request_rebuild()
+  print('Typeahead index rebuilt: {} names'.format(len(typeahead)))
+
+@app.cli.command('worker')
+@click.option('--threads', default=4, show_default=True, help='Jobs run at the same time.')
+@click.option('--poll', default=1.0, show_default=True, help='Seconds to wait when the queue is empty.')
+@click.option('--burst', is_flag=True, help='Exit once no job is ready.')
+def worker_command(threads, poll, burst):
+  """Run queued background jobs; see jobs.py."""
+  jobs_logger.addHandler(logging.StreamHandler())
+  jobs.work(threads, poll, burst)
+
+@app.cli.command('explain-check')
+@click.option('--min-rows', default=1000, show_default=True, help='Full scans of smaller tables are allowed.')
+def explain_check_command(min_rows):
+  """Fail if a hot page's queries scan a large table in full.
+
+  Run against a seeded database (flask seed); see explain.py.
+  """
+  if db.engine.dialect.name not in explain.DIALECTS:
+    print('Skipped: the EXPLAIN check only understands {} plans'.format(' and '.join(explain.DIALECTS)))
+    return
+  violations = explain.check(app, cache, min_rows)
+  for url, table, rows, statement in violations:
+    print('{}: full scan of {} ({} rows)\n  {}'.format(url, table, rows, ' '.join(statement.split())))
+  if violations:
+    sys.exit(1)
+  print('No full scans of tables over {} rows'.format(min_rows))
+
+@app.cli.command('build-assets')
+@click.option('--clean', is_flag=True, help='Remove files from earlier builds first.')
+def build_assets_command(clean):
+  """Fingerprint, bundle and precompress static/ into static/dist/."""
+  manifest = build_assets(app.static_folder, clean)
+  print('Built {} assets into {}'.format(len(manifest), assets.dist))
+
+@app.route('/_stats/cache')
+def cache_stats():
+  require_token()
+  return cache.stats()
+
+@app.route('/_stats/typeahead')
+def typeahead_stats():
+  require_token()
+  return typeahead.stats()
+
+@app.route('/_stats/facets')
+def facet_stats():
+  require_token()
+  return {kind: index.stats() for kind, index in facet_indexes.items()}
+
+@app.route('/_stats/matchmaking')
+def matchmaking_stats():
+  require_token()
+  return {kind: index.stats() for kind, index in match_indexes.items()}
+
+@app.route('/_stats/jobs')
+def job_stats():
+  require_token()
+  return jobs.stats()
+
+@app.errorhandler(400)
+def bad_request_error(error):
+    if api.is_api_request():
+        return api.error_response(error)
+    return error
+
 @app.errorhandler(404)
 def not_found_error(error):
+    if api.is_api_request():
+        return api.error_response(error)
     return render_template('errors/404.html'), 404
 
 @app.errorhandler(500)
 def server_error(error):
+    if api.is_api_request():
+        return api.error_response(error)
     return render_template('errors/500.html'), 500
 
 
+file_handler = FileHandler('error.log')
+file_handler.setFormatter(
+    Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+)
+file_handler.setLevel(logging.INFO)
+
 if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
     app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+# Slow queries and likely N+1 patterns are logged in debug mode too.
+sql_logger.setLevel(logging.WARNING)
+sql_logger.addHandler(file_handler)
+
+jobs_logger.setLevel(logging.INFO)
+jobs_logger.addHandler(file_handler)
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
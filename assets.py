@@ -0,0 +1,213 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+#----------------------------------------------------------------------------#
+# Static assets.
+#----------------------------------------------------------------------------#
+
+# `flask build-assets` copies everything under static/ to static/dist/
+# with a content hash in its name (css/main.css -> css/main.1a2b3c4d.css),
+# joins the BUNDLES into single minified files, and writes .gz (and, with
+# the brotli package installed, .br) copies of every text file next to
+# them. static/dist/manifest.json maps the original names to the built
+# ones.
+#
+# Templates link assets with asset_url('img/front-splash.jpg') or, for a
+# bundle, loop over asset_urls('css/app.css'). With a manifest these point
+# into /static/dist/, which is served with a one year immutable
+# Cache-Control and the precompressed copy the client accepts. Without one
+# (e.g. in development) they fall back to the plain /static/ files, so
+# the build is only needed for deployment.
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+ONE_YEAR = 365 * 24 * 60 * 60
+
+BUNDLES = {
+    'css/app.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'js/head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    # Loaded with defer at the end of the page, after jQuery.
+    'js/app.js': [
+        'js/script.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+}
+
+# Already compressed formats gain nothing from gzip or brotli.
+COMPRESSIBLE = {'.css', '.js', '.map', '.svg', '.ttf', '.otf', '.eot', '.json', '.txt', '.html', '.ico'}
+MIN_COMPRESS_SIZE = 256
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+_SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.M)
+
+
+def minify_css(css):
+    # Comments and whitespace only; nothing that could change meaning.
+    css = _CSS_COMMENT.sub('', css)
+    css = _CSS_SPACE.sub(' ', css)
+    css = _CSS_PUNCTUATION.sub(r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(path, js):
+    # Files already shipped minified are left alone; the rest go through
+    # rjsmin when it is installed.
+    if rjsmin is None or path.endswith('.min.js'):
+        return js
+    return rjsmin.jsmin(js)
+
+
+def _fingerprint(name, data):
+    root, ext = posixpath.splitext(name)
+    return '{}.{}{}'.format(root, hashlib.md5(data).hexdigest()[:8], ext)
+
+
+def _write(dist, name, data):
+    path = os.path.join(dist, *name.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if posixpath.splitext(name)[1] in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data))
+
+
+def _rewrite_css_urls(css, source, manifest):
+    # url(...) in a bundled stylesheet is relative to its original file;
+    # point it at the fingerprinted copy instead.
+    def replace(match):
+        target = match.group(2)
+        if ':' in target or target.startswith(('/', '#')):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', target).groups()
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+        if resolved not in manifest:
+            return match.group(0)
+        return 'url("/static/{}/{}{}")'.format(DIST, manifest[resolved], suffix)
+    return _CSS_URL.sub(replace, css)
+
+
+def build(static_folder, clean=False):
+    # Build static/dist and return the manifest. Files from earlier builds
+    # are kept unless clean is set, so pages rendered before a deploy can
+    # still load the assets they link to.
+    dist = os.path.join(static_folder, DIST)
+    if clean and os.path.isdir(dist):
+        shutil.rmtree(dist)
+
+    manifest = {}
+    for directory, subdirectories, files in os.walk(static_folder):
+        if directory == static_folder and DIST in subdirectories:
+            subdirectories.remove(DIST)
+        for filename in sorted(files):
+            if filename.startswith('.'):
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            manifest[name] = _fingerprint(name, data)
+            _write(dist, manifest[name], data)
+
+    for bundle, members in BUNDLES.items():
+        parts = []
+        for member in members:
+            with open(os.path.join(static_folder, *member.split('/')), encoding='utf-8') as f:
+                text = f.read()
+            if bundle.endswith('.css'):
+                parts.append(minify_css(_rewrite_css_urls(text, member, manifest)))
+            else:
+                parts.append(_SOURCE_MAP.sub('', minify_js(member, text)))
+        # A lone ';' line keeps one file's last statement from running
+        # into the next file's first.
+        data = ('\n' if bundle.endswith('.css') else '\n;\n').join(parts).encode('utf-8')
+        manifest[bundle] = _fingerprint(bundle, data)
+        _write(dist, manifest[bundle], data)
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class Assets:
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.dist = os.path.join(app.static_folder, DIST)
+        self.load()
+        app.add_url_rule('/static/{}/<path:filename>'.format(DIST), 'dist', self.send)
+        app.jinja_env.globals.update(asset_url=self.url, asset_urls=self.urls)
+
+    def load(self):
+        try:
+            with open(os.path.join(self.dist, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def url(self, filename):
+        # url_for('static', filename=...) for the fingerprinted copy if
+        # there is one.
+        if filename in self.manifest:
+            return url_for('dist', filename=self.manifest[filename])
+        return url_for('static', filename=filename)
+
+    def urls(self, bundle):
+        # The built bundle, or its members when assets are not built.
+        if bundle in self.manifest:
+            return [self.url(bundle)]
+        return [url_for('static', filename=member) for member in BUNDLES[bundle]]
+
+    def send(self, filename):
+        # Fingerprinted names never change content, so they can be cached
+        # for good; serve the smallest precompressed copy the client takes.
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encodings = request.accept_encodings
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if encoding in encodings and os.path.isfile(os.path.join(self.dist, *(filename + suffix).split('/'))):
+                response = send_from_directory(self.dist, filename + suffix, mimetype=mimetype,
+                                               max_age=ONE_YEAR)
+                response.content_encoding = encoding
+                break
+        else:
+            response = send_from_directory(self.dist, filename, mimetype=mimetype, max_age=ONE_YEAR)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,63 @@
+"""Micro-benchmark for the `datetime` template filter.
+
+Compares the filter from filters.py with the original implementation,
+which took str(start_time), parsed it back with dateutil and formatted it
+with babel.dates.format_datetime on every call.
+
+    python benchmarks/bench_datetime_filter.py [--tiles 5000] [--distinct 500]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import timeit
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from filters import make_datetime_filter
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tiles', type=int, default=5000, help='filter calls per page render')
+    parser.add_argument('--distinct', type=int, default=500, help='distinct start times on the page')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    base = datetime.datetime(2026, 1, 1, 20, 0)
+    distinct = [base + datetime.timedelta(hours=rng.randrange(24 * 365)) for _ in range(args.distinct)]
+    page = [rng.choice(distinct) for _ in range(args.tiles)]
+
+    fast = make_datetime_filter()
+    for value in distinct:
+        for format in ('full', 'medium'):
+            assert fast(value, format) == legacy_format_datetime(str(value), format), value
+
+    cases = [
+        ('legacy (str + parse + format)', lambda: [legacy_format_datetime(str(value), 'full') for value in page]),
+        ('new, cold cache', lambda: (fast.cache_clear(), [fast(value, 'full') for value in page])),
+        ('new, warm cache', lambda: [fast(value, 'full') for value in page]),
+    ]
+    print('{} tiles, {} distinct start times, best of {}'.format(args.tiles, args.distinct, args.repeat))
+    baseline = None
+    for name, run in cases:
+        best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print('  {:<32} {:8.2f} ms  {:6.1f}x'.format(name, best * 1000, baseline / best))
+
+
+if __name__ == '__main__':
+    main()
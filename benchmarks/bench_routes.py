@@ -0,0 +1,208 @@
+"""Route benchmark for every page in app.py.
+
+Drives each GET route (and the two search POSTs) through the Flask test
+client against the database in DATABASE_URL, and reports p50/p95/p99
+latency, queries per request and peak Python memory per route.
+
+    DATABASE_URL=postgresql://localhost/fyyur_bench flask seed --venues 50000 ...
+    DATABASE_URL=postgresql://localhost/fyyur_bench python benchmarks/bench_routes.py
+    python benchmarks/bench_routes.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_routes.py --compare benchmarks/baseline.json
+
+--compare exits non-zero when a route's p95 latency or peak memory grows
+by more than --tolerance, or its query count grows at all. Routes that
+write (create/edit POSTs, DELETEs) are not driven, so the benchmark can
+be re-run against the same seeded database.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from flask import url_for
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import app as fyyur
+from cache import NullBackend
+from models import db, Venue, Artist
+from seed import GENRES
+
+SEARCH_TERMS = ['Hop', 'Music', 'band', 'A', 'the', 'Velvet Lounge', 'zz']
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def sample_ids(model, count, rng):
+    low, high = db.session.query(db.func.min(model.id), db.func.max(model.id)).one()
+    if low is None:
+        return []
+    ids = set()
+    while len(ids) < count:
+        candidate = db.session.query(model.id).filter(model.id >= rng.randint(low, high)) \
+          .order_by(model.id).limit(1).scalar()
+        ids.add(candidate if candidate is not None else high)
+    return sorted(ids)
+
+
+def sample_availability(count, rng):
+    # Query strings for /api/v1/venues/available: evening windows over the
+    # next month in areas that have venues, half of them narrowed by genre.
+    areas = db.session.query(Venue.city, Venue.state).distinct().order_by(Venue.state, Venue.city).all()
+    if not areas:
+        return []
+    today = datetime.datetime.now().replace(hour=20, minute=0, second=0, microsecond=0)
+    queries = []
+    for _ in range(count):
+        start = today + datetime.timedelta(days=rng.randint(1, 30))
+        city, state = rng.choice(areas)
+        args = {'start': start.isoformat(), 'end': (start + datetime.timedelta(hours=3)).isoformat(),
+                'city': city, 'state': state}
+        if rng.random() < 0.5:
+            args['genres'] = rng.choice(GENRES)
+        queries.append(args)
+    return queries
+
+
+def build_requests(app, rng, samples):
+    # (name, method, url, form) for every GET rule plus the search POSTs.
+    with app.app_context():
+        values = {
+            'venue_id': sample_ids(Venue, samples, rng),
+            'artist_id': sample_ids(Artist, samples, rng),
+        }
+        # Query strings for routes that answer 400 without them.
+        query_args = {
+            'api_available_venues': sample_availability(samples, rng),
+        }
+
+    requests = []
+    with app.test_request_context():
+        for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+            if rule.endpoint == 'static' or rule.rule.startswith('/_'):
+                continue
+            if 'GET' in rule.methods:
+                if rule.endpoint in query_args:
+                    urls = [url_for(rule.endpoint, **args) for args in query_args[rule.endpoint]]
+                    if urls:
+                        requests.append((rule.rule, 'GET', urls, None))
+                elif not rule.arguments:
+                    requests.append((rule.rule, 'GET', [url_for(rule.endpoint)], None))
+                elif rule.arguments <= set(values):
+                    argument = next(iter(rule.arguments))
+                    urls = [url_for(rule.endpoint, **{argument: value}) for value in values[argument]]
+                    if urls:
+                        requests.append((rule.rule, 'GET', urls, None))
+            if 'POST' in rule.methods and rule.endpoint.startswith('search_'):
+                forms = [{'search_term': term} for term in SEARCH_TERMS]
+                requests.append((rule.rule + ' [POST]', 'POST', [url_for(rule.endpoint)], forms))
+    return requests
+
+
+def run_route(client, profiler, method, urls, forms, iterations, rng):
+    latencies, queries = [], []
+    for _ in range(iterations):
+        url = rng.choice(urls)
+        data = rng.choice(forms) if forms else None
+        with profiler.record() as recorder:
+            started = time.perf_counter()
+            response = client.open(url, method=method, data=data)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError('{} {} returned {}'.format(method, url, response.status_code))
+        queries.append(recorder.count)
+
+    # Memory is measured on a separate request so tracing does not skew
+    # the latency numbers.
+    tracemalloc.start()
+    client.open(urls[0], method=method, data=forms[0] if forms else None)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'queries': statistics.mean(queries),
+        'peak_kb': peak / 1024,
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for route, now in results.items():
+        before = baseline.get(route)
+        if before is None:
+            continue
+        if now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append('{}: p95 {:.1f} ms -> {:.1f} ms'.format(route, before['p95_ms'], now['p95_ms']))
+        if now['queries'] > before['queries']:
+            regressions.append('{}: queries {:.1f} -> {:.1f}'.format(route, before['queries'], now['queries']))
+        if now['peak_kb'] > before['peak_kb'] * (1 + tolerance):
+            regressions.append('{}: peak {:.0f} KB -> {:.0f} KB'.format(route, before['peak_kb'], now['peak_kb']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests per route')
+    parser.add_argument('--samples', type=int, default=20, help='distinct ids per detail route')
+    parser.add_argument('--cache', action='store_true', help='keep the data cache enabled')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative growth')
+    args = parser.parse_args()
+
+    app = fyyur.app
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    if not args.cache:
+        fyyur.cache.backend = NullBackend()
+    client = app.test_client()
+    rng = random.Random(args.seed)
+
+    results = {}
+    print('{:<36} {:>9} {:>9} {:>9} {:>8} {:>10}'.format('route', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'peak KB'))
+    for name, method, urls, forms in build_requests(app, rng, args.samples):
+        try:
+            run_route(client, fyyur.profiler, method, urls, forms, args.warmup, rng)
+            stats = run_route(client, fyyur.profiler, method, urls, forms, args.iterations, rng)
+        except RuntimeError as e:
+            # A broken page should not hide the numbers for the others.
+            print('{:<36} skipped: {}'.format(name, e))
+            continue
+        results[name] = stats
+        print('{:<36} {p50_ms:9.2f} {p95_ms:9.2f} {p99_ms:9.2f} {queries:8.1f} {peak_kb:10.0f}'.format(name, **stats))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('Baseline written to {}'.format(args.save_baseline))
+
+    if args.compare:
+        if not os.path.exists(args.compare):
+            print('No baseline at {}; run with --save-baseline first'.format(args.compare))
+            return 0
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('Regressions:')
+            for line in regressions:
+                print('  ' + line)
+            return 1
+        print('No regressions against {}'.format(args.compare))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
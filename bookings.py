@@ -0,0 +1,154 @@
+import datetime
+from bisect import bisect_right
+from collections import defaultdict
+from sqlalchemy import or_
+from models import db, Show, SHOW_DURATION
+
+#----------------------------------------------------------------------------#
+# Double-booking checks.
+#----------------------------------------------------------------------------#
+
+# A show occupies its venue and its artist over [start_time, end_time).
+# Two shows may not overlap at the same venue or with the same artist.
+#
+# On PostgreSQL the rule is enforced by two exclusion constraints on
+# tsrange(start_time, end_time) (migration a4d9e3c7b215), whose GiST
+# indexes also answer the overlap queries below. The checks here give a
+# readable message before the database has to refuse the insert.
+#
+# No show lasts longer than MAX_DURATION, so the shows that can overlap a
+# new one all start in (start - MAX_DURATION, end): one bounded range scan
+# of ix_Show_venue_id_start_time or ix_Show_artist_id_start_time each.
+#
+# Imports check a whole batch in memory instead: the existing shows of the
+# batch's venues and artists around its time span are loaded once into a
+# Schedule per venue and per artist, and every row is checked against and
+# then added to them, which also catches clashes within the batch.
+
+MAX_DURATION = datetime.timedelta(hours=24)
+
+
+def parse_duration(minutes):
+    # Show length from a form or import value in minutes, SHOW_DURATION
+    # when blank. Raises ValueError unless it is a whole number of minutes
+    # between 1 and MAX_DURATION.
+    if minutes in (None, ''):
+        return SHOW_DURATION
+    duration = datetime.timedelta(minutes=int(minutes))
+    if not datetime.timedelta(0) < duration <= MAX_DURATION:
+        raise ValueError('duration must be between 1 and {} minutes'.format(
+            int(MAX_DURATION.total_seconds() // 60)))
+    return duration
+
+
+def _describe(kind, entity_id, show_id, start, end):
+    return '{} {} is already booked from {:%Y-%m-%d %H:%M} to {:%Y-%m-%d %H:%M} (show {}).'.format(
+        kind, entity_id, start, end, show_id)
+
+
+def conflicts(venue_id, artist_id, start, end, exclude_id=None):
+    # Messages for every existing show that overlaps [start, end) at the
+    # venue or with the artist; empty when the booking is free.
+    query = db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time) \
+        .filter(or_(Show.venue_id == venue_id, Show.artist_id == artist_id),
+                Show.start_time > start - MAX_DURATION,
+                Show.start_time < end,
+                Show.end_time > start)
+    if exclude_id is not None:
+        query = query.filter(Show.id != exclude_id)
+    messages = []
+    for show in query.order_by(Show.start_time):
+        if show.venue_id == venue_id:
+            messages.append(_describe('Venue', venue_id, show.id, show.start_time, show.end_time))
+        if show.artist_id == artist_id:
+            messages.append(_describe('Artist', artist_id, show.id, show.start_time, show.end_time))
+    return messages
+
+
+class Schedule:
+    # Disjoint [start, end) bookings of one venue or artist, sorted by
+    # start. Since they are disjoint they are sorted by end too, so only
+    # the bookings either side of a new start can overlap it: O(log n).
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, start, end):
+        # (id, start, end) of a booking overlapping [start, end), or None.
+        index = bisect_right(self.starts, start)
+        if index and self.ends[index - 1] > start:
+            index -= 1
+        elif index == len(self.starts) or self.starts[index] >= end:
+            return None
+        return self.ids[index], self.starts[index], self.ends[index]
+
+    def add(self, start, end, booking_id=None):
+        # Empty ranges never overlap anything, as in PostgreSQL.
+        if end <= start:
+            return
+        index = bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self.ids.insert(index, booking_id)
+
+
+class Bookings:
+    # Schedules of many venues and artists, for checking a batch of shows.
+
+    def __init__(self):
+        self.venues = defaultdict(Schedule)
+        self.artists = defaultdict(Schedule)
+
+    @classmethod
+    def load(cls, venue_ids, artist_ids, start, end):
+        # The existing shows of those venues and artists that could overlap
+        # anything in [start, end).
+        bookings = cls()
+        for fk, ids, schedules in ((Show.venue_id, venue_ids, bookings.venues),
+                                   (Show.artist_id, artist_ids, bookings.artists)):
+            ids = list(ids)
+            if not ids:
+                continue
+            rows = db.session.query(fk, Show.id, Show.start_time, Show.end_time) \
+                .filter(fk.in_(ids), Show.start_time > start - MAX_DURATION, Show.start_time < end)
+            for entity_id, show_id, show_start, show_end in rows:
+                schedules[entity_id].add(show_start, show_end, show_id)
+        return bookings
+
+    def conflicts(self, venue_id, artist_id, start, end):
+        messages = []
+        for kind, entity_id, schedules in (('Venue', venue_id, self.venues),
+                                           ('Artist', artist_id, self.artists)):
+            clash = schedules[entity_id].overlapping(start, end) if entity_id in schedules else None
+            if clash:
+                messages.append(_describe(kind, entity_id, *clash) if clash[0] is not None else
+                                '{} {} is already booked at that time in this import.'.format(kind, entity_id))
+        return messages
+
+    def add(self, venue_id, artist_id, start, end, show_id=None):
+        self.venues[venue_id].add(start, end, show_id)
+        self.artists[artist_id].add(start, end, show_id)
+
+
+def check_batch(batch):
+    # {line: {'start_time': [messages]}} for the (line, row) show rows that
+    # clash with an existing show or an earlier row of the batch.
+    if not batch:
+        return {}
+    bookings = Bookings.load({row['venue_id'] for _, row in batch},
+                             {row['artist_id'] for _, row in batch},
+                             min(row['start_time'] for _, row in batch),
+                             max(row['end_time'] for _, row in batch))
+    clashes = {}
+    for line, row in batch:
+        messages = bookings.conflicts(row['venue_id'], row['artist_id'], row['start_time'], row['end_time'])
+        if messages:
+            clashes[line] = {'start_time': messages}
+        else:
+            bookings.add(row['venue_id'], row['artist_id'], row['start_time'], row['end_time'])
+    return clashes
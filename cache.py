@@ -0,0 +1,225 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+#----------------------------------------------------------------------------#
+# Data cache.
+#----------------------------------------------------------------------------#
+
+# Caches the data the GET views build, keyed by view and arguments, with a
+# TTL and LRU eviction. Entries carry a few tags: the listing they belong
+# to ('venues', 'artists', 'shows') or the page they are ('venue:3',
+# 'artist:7'). Every tag has a token, and an entry remembers the tokens its
+# tags had when it was built. Invalidating a tag drops its token, so a new
+# one is made on the next read and entries stored under the old one are
+# misses from then on; write handlers only need to name the tags they
+# touched.
+#
+# Tokens live in a backend of their own, so pages never evict tokens and
+# invalidating many tags at once never evicts pages.
+#
+# Backends:
+#   memory - per-process OrderedDict
+#   disk   - one pickle file per key under CACHE_DIR, shared by processes
+#   null   - caches nothing
+
+
+class NullBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskBackend:
+    # Recency is the file's mtime, refreshed on every hit. Eviction runs
+    # every PRUNE_EVERY writes rather than on each one, so the directory can
+    # briefly hold a few more than max_entries files.
+    PRUNE_EVERY = 64
+
+    def __init__(self, directory, max_entries=2048):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def _files(self):
+        with os.scandir(self.directory) as entries:
+            return [entry for entry in entries if entry.is_file() and not entry.name.startswith('.')]
+
+    def prune(self):
+        files = self._files()
+        excess = len(files) - self.max_entries
+        if excess <= 0:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:excess]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self._files())
+
+
+class Cache:
+    def __init__(self, backend, default_ttl=60, tags=None):
+        self.backend = backend
+        self.tags = tags if tags is not None else MemoryBackend(65536)
+        self.default_ttl = default_ttl
+        # Optional callable; while it returns True, lookups are treated as
+        # misses and the rebuilt value replaces the cached one.
+        self.bypass = None
+        # Optional callable; a value it returns other than None becomes
+        # part of every key, so entries built under another version (e.g.
+        # an older database watermark) are misses.
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        kind = config.get('CACHE_TYPE', 'memory')
+        max_entries = config.get('CACHE_MAX_ENTRIES', 2048)
+        max_tags = config.get('CACHE_MAX_TAGS', 65536)
+        if kind == 'memory':
+            backend, tags = MemoryBackend(max_entries), MemoryBackend(max_tags)
+        elif kind == 'disk':
+            backend = DiskBackend(config['CACHE_DIR'], max_entries)
+            tags = DiskBackend(os.path.join(config['CACHE_DIR'], 'tags'), max_tags)
+        elif kind == 'null':
+            backend, tags = NullBackend(), NullBackend()
+        else:
+            raise ValueError('Unknown CACHE_TYPE {!r}'.format(kind))
+        return cls(backend, config.get('CACHE_DEFAULT_TTL', 60), tags)
+
+    def _token(self, tag):
+        # Tag tokens never expire. If one is evicted or dropped it comes
+        # back as a new token, which can only turn hits into misses, never
+        # the reverse.
+        token = self.tags.get(tag)
+        if token is None:
+            token = uuid.uuid4().hex
+            self.tags.set(tag, token)
+        return token
+
+    def get_or_set(self, key, build, tags=(), ttl=None):
+        # Return the cached value for key, or build(), cache and return it.
+        version = self.version() if self.version else None
+        if version is not None:
+            key = '{}@{}'.format(key, hashlib.sha1(repr(version).encode('utf-8')).hexdigest())
+        entry = None if self.bypass and self.bypass() else self.backend.get('data:' + key)
+        if entry is not None:
+            entry_tags, value = entry
+            if all(self._token(tag) == token for tag, token in entry_tags):
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        # Tokens are read before building so that an invalidation racing
+        # with the build leaves the new entry already stale.
+        entry_tags = [(tag, self._token(tag)) for tag in tags]
+        value = build()
+        self.backend.set('data:' + key, (entry_tags, value), ttl or self.default_ttl)
+        return value
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.tags.delete(tag)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'tags': len(self.tags),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+        }
@@ -0,0 +1,87 @@
+import datetime
+import hashlib
+import os
+from functools import wraps
+from flask import g, make_response, request, session
+
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#----------------------------------------------------------------------------#
+
+# @conditional(validators) answers If-None-Match / If-Modified-Since with a
+# 304 before the view runs. validators(**view_args) returns a tuple of
+# watermark values (datetimes or None) for the page, or None when there is
+# nothing to compare, in which case the view runs as usual. The ETag hashes
+# the watermark together with the URL and a deploy salt, so template and
+# asset changes also produce new ETags.
+#
+# The view's data may come from a per-process cache that other workers'
+# writes do not invalidate. current_watermark() returns the watermark the
+# ETag was made from, and the data cache folds it into its keys (see
+# Cache.version), so a body is never served under an ETag newer than the
+# data it was built from.
+
+def _deploy_salt():
+    # Templates and the asset manifest, since pages link fingerprinted
+    # asset names.
+    here = os.path.dirname(os.path.abspath(__file__))
+    latest = 0
+    for directory, _, files in os.walk(os.path.join(here, 'templates')):
+        for name in files:
+            latest = max(latest, os.path.getmtime(os.path.join(directory, name)))
+    manifest = os.path.join(here, 'static', 'dist', 'manifest.json')
+    if os.path.exists(manifest):
+        latest = max(latest, os.path.getmtime(manifest))
+    return str(latest)
+
+DEPLOY_SALT = _deploy_salt()
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr((DEPLOY_SALT,) + parts).encode('utf-8')).hexdigest()
+
+
+def last_modified(watermark):
+    # Latest timestamp in the watermark as an aware UTC datetime. Stored
+    # times are naive local time, like the rest of the app.
+    stamps = [value for value in watermark if isinstance(value, datetime.datetime)]
+    if not stamps:
+        return None
+    return max(stamps).astimezone(datetime.timezone.utc).replace(microsecond=0)
+
+
+def current_watermark():
+    return g.get('watermark')
+
+
+def _is_fresh(etag, modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and modified:
+        return modified <= request.if_modified_since
+    return False
+
+
+def conditional(validators):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            watermark = validators(**kwargs)
+            # Pending flash messages are part of the page, so never 304 them.
+            if watermark is None or session.get('_flashes'):
+                return view(**kwargs)
+
+            g.watermark = tuple(watermark)
+            etag = make_etag(request.full_path, g.watermark)
+            modified = last_modified(watermark)
+            if _is_fresh(etag, modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(**kwargs))
+            response.set_etag(etag)
+            if modified:
+                response.last_modified = modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
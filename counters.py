@@ -0,0 +1,126 @@
+import datetime
+from collections import Counter
+from sqlalchemy import bindparam, func, select, update
+from models import db, Venue, Artist, Show, touch
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue.num_upcoming_shows / Venue.venue_past_shows and
+# Artist.num_upcoming_shows / Artist.artist_past_shows are kept up to date
+# here so listing and search pages can read them instead of counting shows.
+# Show.upcoming_show records which of the two counters a show is in.
+#
+# Every function works on the current session and leaves the commit to the
+# caller, so counters are written in the same transaction as the change
+# they describe.
+
+COUNTERS = (
+    (Venue, Show.venue_id, Venue.num_upcoming_shows, Venue.venue_past_shows),
+    (Artist, Show.artist_id, Artist.num_upcoming_shows, Artist.artist_past_shows),
+)
+
+
+def _bump(model, entity_id, column, delta):
+    db.session.query(model).filter(model.id == entity_id).update(
+        {column: func.coalesce(column, 0) + delta},
+        synchronize_session=False
+    )
+
+
+def _apply(model, column, counts, sign):
+    # Add sign * count to column for every {entity_id: count}, in one
+    # executemany UPDATE.
+    if not counts:
+        return
+    statement = update(model.__table__) \
+        .where(model.__table__.c.id == bindparam('entity_id')) \
+        .values({column.key: func.coalesce(column, 0) + bindparam('delta')})
+    db.session.execute(statement, [
+        {'entity_id': entity_id, 'delta': sign * count} for entity_id, count in counts.items()
+    ])
+
+
+def record_show(show, now=None):
+    # Called for a new show, before the commit that inserts it.
+    now = now or datetime.datetime.now()
+    show.upcoming_show = show.start_time > now
+    for model, fk, upcoming, past in COUNTERS:
+        column = upcoming if show.upcoming_show else past
+        _bump(model, getattr(show, fk.key), column, 1)
+
+
+def record_shows(rows, now=None):
+    # Bulk form of record_show for show rows (dicts) about to be inserted
+    # with executemany. Sets each row's upcoming_show and applies one
+    # UPDATE per counter, executed once per distinct venue or artist.
+    now = now or datetime.datetime.now()
+    for row in rows:
+        row['upcoming_show'] = row['start_time'] > now
+    for model, fk, upcoming, past in COUNTERS:
+        for column, is_upcoming in ((upcoming, True), (past, False)):
+            _apply(model, column, Counter(row[fk.key] for row in rows if row['upcoming_show'] == is_upcoming), 1)
+
+
+def _forget_shows(criterion):
+    # Take the shows matching criterion off every counter they were added to.
+    for model, fk, upcoming, past in COUNTERS:
+        rows = db.session.query(fk, Show.upcoming_show, func.count(Show.id)) \
+            .filter(criterion) \
+            .group_by(fk, Show.upcoming_show) \
+            .all()
+        for entity_id, is_upcoming, count in rows:
+            _bump(model, entity_id, upcoming if is_upcoming else past, -count)
+
+
+def forget_venue(venue_id):
+    # Called before a venue (and, by cascade, its shows) is deleted.
+    _forget_shows(Show.venue_id == venue_id)
+
+
+def rollover(now=None):
+    # Move shows that have started from the upcoming to the past counters.
+    # Returns the number of shows that were rolled over.
+    #
+    # The shows are flipped first and the counters follow from the rows the
+    # UPDATE returns. An overlapping run (a cron overlap, or another
+    # instance) waits on the same rows and then finds them no longer
+    # upcoming, so every show is counted once.
+    now = now or datetime.datetime.now()
+    shows = Show.__table__
+    flipped = db.session.execute(
+        update(shows)
+        .where(shows.c.upcoming_show == True, shows.c.start_time <= now)
+        .values(upcoming_show=False)
+        .returning(shows.c.venue_id, shows.c.artist_id)
+    ).all()
+
+    for model, fk, upcoming, past in COUNTERS:
+        counts = Counter(getattr(row, fk.key) for row in flipped)
+        _apply(model, upcoming, counts, -1)
+        _apply(model, past, counts, 1)
+
+    if flipped:
+        touch(db.session, 'Venue', 'Artist', 'Show')
+    return len(flipped)
+
+
+def recount(now=None):
+    # Rebuild every counter from the Show table. Used to backfill existing
+    # data and to repair counters after manual edits to the database.
+    now = now or datetime.datetime.now()
+    db.session.query(Show).update(
+        {Show.upcoming_show: Show.start_time > now}, synchronize_session=False)
+
+    for model, fk, upcoming, past in COUNTERS:
+        def count(is_upcoming):
+            return select(func.count(Show.id)) \
+                .where(fk == model.id, Show.upcoming_show == is_upcoming) \
+                .scalar_subquery()
+
+        db.session.query(model).update({
+            upcoming: count(True),
+            past: count(False)
+        }, synchronize_session=False)
+    touch(db.session, 'Venue', 'Artist', 'Show')
@@ -0,0 +1,109 @@
+import datetime
+from itertools import groupby
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Venue, Show, VenueArea
+
+#----------------------------------------------------------------------------#
+# Venue directory.
+#----------------------------------------------------------------------------#
+
+# VenueArea holds the /venues page ready to render: one row per area with
+# its venues' ids, names and upcoming show counts, read by primary key
+# order. The write handlers refresh just the areas they touched, in the
+# same transaction as the write, so the directory is never out of step
+# with Venue.
+#
+# An area's row is locked while it is recomputed, so two writers in the
+# same area take turns and the second one sees the first one's venue.
+# Readers are never blocked; they see the old row until the commit.
+#
+# Upcoming counts move with the clock: rollover-shows refreshes the areas
+# whose shows it rolls over, and `flask refresh-venue-directory` rebuilds
+# every row.
+#
+# Every function works on the current session and leaves the commit to the
+# caller, like counters.py.
+
+
+def _venues(state, city):
+    rows = db.session.query(Venue.id, Venue.name, Venue.num_upcoming_shows) \
+        .filter(Venue.state == state, Venue.city == city) \
+        .order_by(Venue.name, Venue.id) \
+        .all()
+    return [_entry(row) for row in rows]
+
+
+def _entry(row):
+    return {'id': row.id, 'name': row.name, 'num_upcoming_shows': row.num_upcoming_shows or 0}
+
+
+def _ensure_row(state, city):
+    # Insert an empty row unless one exists, so there is always a row to
+    # lock, even for an area that is still being created by another writer.
+    dialect = db.session.connection().dialect.name
+    if dialect == 'postgresql':
+        statement = postgresql.insert(VenueArea.__table__).on_conflict_do_nothing()
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(VenueArea.__table__).on_conflict_do_nothing()
+    else:
+        if db.session.query(VenueArea.state).filter_by(state=state, city=city).first():
+            return
+        statement = VenueArea.__table__.insert()
+    db.session.execute(statement.values(state=state, city=city, venues=[]))
+
+
+def refresh_areas(areas):
+    # Recompute the rows of the given (state, city) areas. Areas left
+    # without venues are removed.
+    for state, city in sorted(set(areas)):
+        _ensure_row(state, city)
+        db.session.query(VenueArea.state) \
+            .filter_by(state=state, city=city) \
+            .with_for_update() \
+            .one()
+        venues = _venues(state, city)
+        area = VenueArea.__table__
+        where = (area.c.state == state) & (area.c.city == city)
+        if venues:
+            db.session.execute(area.update().where(where).values(venues=venues))
+        else:
+            db.session.execute(area.delete().where(where))
+
+
+def venue_areas(venue_ids):
+    # The areas of the given venues, e.g. before they are moved or deleted.
+    venue_ids = list(venue_ids)
+    if not venue_ids:
+        return []
+    return [tuple(row) for row in db.session.query(Venue.state, Venue.city)
+            .filter(Venue.id.in_(venue_ids)).distinct()]
+
+
+def refresh_venues(venue_ids):
+    refresh_areas(venue_areas(venue_ids))
+
+
+def started_areas(now=None):
+    # Areas with upcoming shows that have started; what counters.rollover
+    # will change. Call it before the rollover.
+    now = now or datetime.datetime.now()
+    return [tuple(row) for row in db.session.query(Venue.state, Venue.city)
+            .join(Show, Show.venue_id == Venue.id)
+            .filter(Show.upcoming_show == True, Show.start_time <= now)
+            .distinct()]
+
+
+def rebuild():
+    # Replace every row from one ordered scan of Venue. Used to backfill
+    # and to repair the directory after manual edits to the database.
+    rows = db.session.query(Venue.state, Venue.city, Venue.id, Venue.name, Venue.num_upcoming_shows) \
+        .order_by(Venue.state, Venue.city, Venue.name, Venue.id)
+    db.session.execute(VenueArea.__table__.delete())
+    batch = []
+    for (state, city), area_venues in groupby(rows, key=lambda row: (row.state, row.city)):
+        batch.append({'state': state, 'city': city, 'venues': [_entry(row) for row in area_venues]})
+        if len(batch) >= 1000:
+            db.session.execute(VenueArea.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(VenueArea.__table__.insert(), batch)
@@ -0,0 +1,118 @@
+import json
+import logging
+import re
+from sqlalchemy import func
+from models import db, Venue, Artist, Show
+from cache import NullBackend
+
+#----------------------------------------------------------------------------#
+# EXPLAIN guard.
+#----------------------------------------------------------------------------#
+
+# Requests the hot pages against a seeded database, records every
+# statement they send (see sqlprofiler.py) and runs each one again under
+# EXPLAIN. A full scan of a table holding more than min_rows rows is a
+# violation: it means an index is missing or no longer used.
+#
+#   flask seed --venues 5000 --artists 20000 --shows 200000
+#   flask explain-check --min-rows 1000
+#
+# tests/test_explain.py runs the same check on a seeded test database.
+#
+# Listing pages are checked on their first page and, through the cursor
+# the JSON API hands out, their second. Detail pages are checked for the
+# venue and the artist with the most shows.
+#
+# Only PostgreSQL and SQLite plans are understood; on other databases the
+# check is skipped with a warning and finds nothing.
+
+logger = logging.getLogger('fyyur.explain')
+
+DIALECTS = ('postgresql', 'sqlite')
+
+LISTINGS = [
+    ('/venues', '/api/v1/venues'),
+    ('/artists', '/api/v1/artists'),
+    ('/shows', '/api/v1/shows'),
+]
+
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def table_sizes():
+    return {table.__tablename__: db.session.query(func.count()).select_from(table).scalar()
+            for table in (Venue, Artist, Show)}
+
+
+def _busiest(fk):
+    return db.session.query(fk).group_by(fk).order_by(func.count().desc()).limit(1).scalar()
+
+
+def hot_urls(client):
+    urls = []
+    for page, api in LISTINGS:
+        urls.append(page)
+        next_url = client.get(api).get_json().get('next')
+        if next_url:
+            urls.append(page + next_url[next_url.index('?'):])
+    venue_id, artist_id = _busiest(Show.venue_id), _busiest(Show.artist_id)
+    if venue_id:
+        urls.append('/venues/{}'.format(venue_id))
+    if artist_id:
+        urls.append('/artists/{}'.format(artist_id))
+    return urls
+
+
+def full_scans(statement, parameters):
+    # Tables the database would read in full to run the statement.
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        scanned, nodes = [], [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            if node['Node Type'] == 'Seq Scan':
+                scanned.append(node['Relation Name'])
+            nodes.extend(node.get('Plans', []))
+        return scanned
+    if dialect == 'sqlite':
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        return [match.group(1) for match in (_SQLITE_SCAN.match(row[-1]) for row in rows) if match]
+    return []
+
+
+def check(app, cache, min_rows=1000):
+    # Returns a list of (url, table, rows, statement) violations. Cached
+    # pages send no queries, so the cache is bypassed while checking.
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    if dialect not in DIALECTS:
+        logger.warning('EXPLAIN check skipped: plans from %s are not understood, only %s',
+                       dialect, ' and '.join(DIALECTS))
+        return []
+    profiler = app.extensions['sqlprofiler']
+    backend, cache.backend = cache.backend, NullBackend()
+    try:
+        client = app.test_client()
+        with app.app_context():
+            urls = hot_urls(client)
+            sizes = table_sizes()
+
+        violations = []
+        for url in urls:
+            with profiler.record() as recorder:
+                response = client.get(url)
+            if response.status_code >= 400:
+                raise RuntimeError('GET {} returned {}'.format(url, response.status_code))
+            with app.app_context():
+                for statement, parameters, _ in recorder.statements:
+                    for table in full_scans(statement, parameters):
+                        rows = sizes.get(table, 0)
+                        if rows > min_rows:
+                            violations.append((url, table, rows, statement))
+        return violations
+    finally:
+        cache.backend = backend
@@ -0,0 +1,122 @@
+import csv
+import datetime
+import io
+import json
+import zlib
+from sqlalchemy import select
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Streaming export.
+#----------------------------------------------------------------------------#
+
+# Venues, artists and shows as NDJSON or CSV, written as the rows come off
+# a server-side cursor. Rows are fetched yield_per at a time and encoded a
+# chunk at a time, so an export holds one chunk in memory however many
+# rows it covers.
+#
+# Filters:
+#   start, end   shows by start_time; venues and artists by updated_at
+#                (start inclusive, end exclusive)
+#   city, state  venues and artists by their own, shows by their venue's
+
+FORMATS = ('ndjson', 'csv')
+YIELD_PER = 1000
+
+VENUE_COLUMNS = (
+    Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone,
+    Venue.genres, Venue.website, Venue.facebook_link, Venue.image_link,
+    Venue.seeking_talent, Venue.seeking_description,
+    Venue.num_upcoming_shows, Venue.venue_past_shows, Venue.updated_at,
+)
+
+ARTIST_COLUMNS = (
+    Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+    Artist.genres, Artist.website, Artist.facebook_link, Artist.image_link,
+    Artist.seeking_venue, Artist.seeking_description,
+    Artist.num_upcoming_shows, Artist.artist_past_shows, Artist.updated_at,
+)
+
+SHOW_COLUMNS = (
+    Show.id, Show.start_time, Show.upcoming_show,
+    Show.venue_id, Venue.name.label('venue_name'),
+    Venue.city.label('venue_city'), Venue.state.label('venue_state'),
+    Show.artist_id, Artist.name.label('artist_name'),
+)
+
+
+def _statement(kind, start=None, end=None, city=None, state=None):
+    if kind == 'shows':
+        statement = select(*SHOW_COLUMNS) \
+            .join(Venue, Venue.id == Show.venue_id) \
+            .join(Artist, Artist.id == Show.artist_id) \
+            .order_by(Show.start_time, Show.id)
+        stamp, place = Show.start_time, Venue
+    else:
+        model, columns = (Venue, VENUE_COLUMNS) if kind == 'venues' else (Artist, ARTIST_COLUMNS)
+        statement = select(*columns).order_by(model.id)
+        stamp, place = model.updated_at, model
+
+    if start:
+        statement = statement.where(stamp >= start)
+    if end:
+        statement = statement.where(stamp < end)
+    if city:
+        statement = statement.where(place.city == city)
+    if state:
+        statement = statement.where(place.state == state)
+    return statement
+
+
+def _value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def _ndjson(columns, partition):
+    return ''.join(json.dumps(dict(zip(columns, map(_value, row))), separators=(',', ':')) + '\n'
+                   for row in partition)
+
+
+def _csv_writer():
+    buffer = io.StringIO()
+    return buffer, csv.writer(buffer)
+
+
+def _csv_cell(value):
+    # Arrays go in one cell, comma separated, as importer.py reads them.
+    if isinstance(value, list):
+        return ','.join(value)
+    return _value(value)
+
+
+def rows(kind, format, yield_per=YIELD_PER, **filters):
+    # Yield the export as text chunks, one per yield_per rows.
+    result = db.session.execute(_statement(kind, **filters),
+                                execution_options={'stream_results': True})
+    columns = list(result.keys())
+    buffer, writer = _csv_writer()
+    if format == 'csv':
+        writer.writerow(columns)
+
+    for partition in result.partitions(yield_per):
+        if format == 'csv':
+            writer.writerows([_csv_cell(value) for value in row] for row in partition)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            yield _ndjson(columns, partition)
+    if format == 'csv' and buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzipped(chunks):
+    # gzip a stream of text chunks without buffering it.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
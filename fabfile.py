@@ -13,6 +13,15 @@ def test():
         abort("Aborted at user request.")
 
 
+def bench():
+    with settings(warn_only=True):
+        result = local(
+            "python benchmarks/bench_routes.py --compare benchmarks/baseline.json"
+        )
+    if result.failed and not confirm("Route benchmarks regressed. Continue?"):
+        abort("Aborted at user request.")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -0,0 +1,152 @@
+import logging
+import time
+from forms import VenueForm
+from indexes import RebuildableIndex
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Facet index.
+#----------------------------------------------------------------------------#
+
+# In-process bitmap index for browsing venues or artists by genre, state
+# and seeking flag. Every facet value has a bitset (a Python int) with bit
+# n set when the venue or artist with id n has that value. A selection is
+# the union of the chosen values within each facet, intersected across
+# facets, so counting or listing it is a handful of big-integer ANDs and
+# popcounts however many rows there are.
+#
+# Counts for a facet are taken with the selections of the other facets
+# only, so they tell how many results choosing that value would add.
+#
+# The index is loaded, kept current and rebuilt like the other in-memory
+# indexes, see indexes.py; bulk imports touch its stamp file.
+
+logger = logging.getLogger('fyyur.facets')
+
+KINDS = {
+    'venue': (Venue, Venue.seeking_talent),
+    'artist': (Artist, Artist.seeking_venue),
+}
+
+# Facets and their values in display order, from the choices in forms.py.
+FACETS = {
+    'genre': [value for value, _ in VenueForm.genres.kwargs['choices']],
+    'state': [value for value, _ in VenueForm.state.kwargs['choices']],
+    'seeking': ['yes'],
+}
+
+
+def _keys(genres, state, seeking):
+    keys = [('genre', genre) for genre in genres or ()]
+    keys.append(('state', state))
+    if seeking:
+        keys.append(('seeking', 'yes'))
+    return keys
+
+
+def _popcount(bits):
+    return bits.bit_count() if hasattr(bits, 'bit_count') else bin(bits).count('1')
+
+
+class FacetIndex(RebuildableIndex):
+    def __init__(self, kind, max_age=300, stamp_path=None):
+        RebuildableIndex.__init__(self, max_age, stamp_path)
+        self.kind = kind
+        self.label = 'Facet index for {}s'.format(kind)
+        self._bits = {}
+        self._all = 0
+        self._entries = {}
+
+    @classmethod
+    def from_config(cls, kind, config):
+        return cls(kind, config.get('FACETS_MAX_AGE', 300), config.get('FACETS_STAMP'))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def build(self):
+        # Load every row and set the bits in one bytearray per value, rather
+        # than growing the ints one bit at a time.
+        started = time.time()
+        model, seeking = KINDS[self.kind]
+        rows = db.session.query(model.id, model.genres, model.state, seeking).all()
+        size = max((row[0] for row in rows), default=0) // 8 + 1
+        buffers, entries = {}, {}
+        for entity_id, genres, state, is_seeking in rows:
+            entries[entity_id] = keys = _keys(genres, state, is_seeking)
+            for key in keys + [('all', None)]:
+                buffer = buffers.get(key)
+                if buffer is None:
+                    buffer = buffers[key] = bytearray(size)
+                buffer[entity_id >> 3] |= 1 << (entity_id & 7)
+        bits = {key: int.from_bytes(buffer, 'little') for key, buffer in buffers.items()}
+        with self._lock:
+            self._all = bits.pop(('all', None), 0)
+            self._bits = bits
+            self._entries = entries
+            self.built_at = started
+        logger.info('Facet index for %ss built: %d rows in %.2fs', self.kind, len(entries), time.time() - started)
+
+    def _remove(self, entity_id):
+        mask = ~(1 << entity_id)
+        for key in self._entries.pop(entity_id, ()):
+            self._bits[key] &= mask
+        self._all &= mask
+
+    def put(self, entity_id, genres, state, seeking):
+        # Add or update one venue or artist.
+        bit = 1 << entity_id
+        with self._lock:
+            self._remove(entity_id)
+            self._entries[entity_id] = keys = _keys(genres, state, seeking)
+            for key in keys:
+                self._bits[key] = self._bits.get(key, 0) | bit
+            self._all |= bit
+
+    def discard(self, entity_id):
+        with self._lock:
+            self._remove(entity_id)
+
+    #  Queries
+    #  ----------------------------------------------------------------
+
+    @staticmethod
+    def _select(bits, everything, selected, skip=None):
+        # Rows matching every facet in selected except skip.
+        result = everything
+        for facet, values in selected.items():
+            if facet == skip or not values:
+                continue
+            union = 0
+            for value in values:
+                union |= bits.get((facet, value), 0)
+            result &= union
+        return result
+
+    def search(self, selected, before=None, limit=50):
+        # (total, ids, counts) for selected, a {facet: [values]} dict. ids
+        # are the newest `limit` matches below id `before`; counts maps each
+        # facet to {value: count}.
+        with self._lock:
+            bits, everything = self._bits, self._all
+            matched = self._select(bits, everything, selected)
+            counts = {}
+            for facet, values in FACETS.items():
+                base = self._select(bits, everything, selected, skip=facet) if selected.get(facet) else matched
+                counts[facet] = {value: _popcount(base & bits.get((facet, value), 0)) for value in values}
+
+        remaining = matched if before is None else matched & ((1 << before) - 1)
+        ids = []
+        while remaining and len(ids) < limit:
+            entity_id = remaining.bit_length() - 1
+            ids.append(entity_id)
+            remaining ^= 1 << entity_id
+        return _popcount(matched), ids, counts
+
+    def stats(self):
+        return {
+            'rows': len(self._entries),
+            'bitsets': len(self._bits),
+            'built_at': self.built_at,
+            'rebuilding': self._rebuilding,
+        }
@@ -0,0 +1,52 @@
+from functools import lru_cache
+import babel.dates
+import dateutil.parser
+import pytz
+from babel import Locale
+
+#----------------------------------------------------------------------------#
+# Template filters.
+#----------------------------------------------------------------------------#
+
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+LOCALE = Locale.parse('en')
+
+
+@lru_cache(maxsize=64)
+def _pattern(format):
+    return babel.dates.parse_pattern(PATTERNS.get(format, format))
+
+
+def make_datetime_filter(display_timezone=None, storage_timezone='UTC', cache_size=4096):
+    # Build the `datetime` filter. It takes datetimes as well as strings,
+    # applies precompiled Babel patterns and memoizes up to cache_size
+    # formatted values, since the same start times repeat across a page.
+    #
+    # With display_timezone set, naive values are read as storage_timezone
+    # and shown in display_timezone. Without it they are shown as stored.
+    display = pytz.timezone(display_timezone) if display_timezone else None
+    storage = pytz.timezone(storage_timezone)
+
+    @lru_cache(maxsize=cache_size)
+    def render(value, format):
+        if isinstance(value, str):
+            value = dateutil.parser.parse(value)
+        if display is not None:
+            if value.tzinfo is None:
+                value = storage.localize(value)
+            value = display.normalize(value.astimezone(display))
+        if format in ('short', 'long'):
+            # Babel's named formats are locale driven, not patterns.
+            return babel.dates.format_datetime(value, format, locale=LOCALE)
+        return _pattern(format).apply(value, LOCALE)
+
+    def format_datetime(value, format='medium'):
+        return render(value, format)
+
+    format_datetime.cache_info = render.cache_info
+    format_datetime.cache_clear = render.cache_clear
+    return format_datetime
@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, NumberRange, Optional
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -15,6 +15,12 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    # Minutes; see bookings.MAX_DURATION.
+    duration = IntegerField(
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=24 * 60)],
+        default=120
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -0,0 +1,323 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import logging
+import os
+import re
+import socket
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
+from flask import abort, redirect, request, send_file, url_for
+from models import db, Venue, Artist
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# What a broken, hostile or unreachable source can raise while an image is
+# fetched and rendered. DecompressionBombError is not an OSError.
+_IMAGE_ERRORS = (OSError, ValueError) + ((Image.DecompressionBombError,) if Image is not None else ())
+
+#----------------------------------------------------------------------------#
+# Image proxy.
+#----------------------------------------------------------------------------#
+
+# Venue and artist images are served from /images/<kind>/<id>/<size>
+# instead of hot-linking image_link. The first request for an image
+# fetches the original once into IMAGE_CACHE_DIR; every size is then
+# rendered from that copy, as WebP for clients that accept it and JPEG
+# (PNG when there is transparency) for the rest. Without Pillow the
+# original is served as is, still from the local copy.
+#
+# URLs carry ?v=<hash of image_link>, so a response never changes for its
+# URL and is cached for a year; editing image_link changes the URL. Cache
+# hits are answered from disk without a database query. Only the stored
+# image_link of an existing venue or artist is ever fetched.
+#
+# image_link is user input, so fetching it must not reach anything a
+# visitor could not: hosts are resolved and connected to by address, every
+# address must be public (no loopback, private, link-local or reserved
+# ranges), redirects are not followed and proxies from the environment are
+# not used. Without Pillow only bytes recognisable as an image are served.
+#
+# The cache directory is kept under IMAGE_CACHE_MAX_BYTES by deleting the
+# least recently used files. IMAGE_FIXTURE_DIR, when set, stands in for
+# the network: https://host/path is read from <IMAGE_FIXTURE_DIR>/host/path.
+
+logger = logging.getLogger('fyyur.images')
+
+# Bounding boxes matching the stylesheet: tiles are max-height 200px in a
+# col-sm-4, detail images max-height 500px in a col-sm-6.
+SIZES = {
+    'tile': (360, 200),
+    'detail': (555, 500),
+}
+
+KINDS = {'venue': Venue, 'artist': Artist}
+ONE_YEAR = 365 * 24 * 60 * 60
+_VERSION = re.compile(r'[0-9a-f]{12}')
+
+
+def version(link):
+    return hashlib.sha1(link.encode('utf-8')).hexdigest()[:12]
+
+
+#  Fetching
+#  ----------------------------------------------------------------
+
+def _public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    # socket.create_connection for image sources: resolves the host once,
+    # refuses it unless every address is public, and connects to one of
+    # those addresses, so a second lookup cannot point somewhere else.
+    host, port = address
+    addresses = [sockaddr[0] for _, _, _, _, sockaddr in
+                 socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    for candidate in addresses:
+        if not ipaddress.ip_address(candidate.split('%')[0]).is_global:
+            raise ValueError('Image host {} resolves to non-public address {}'.format(host, candidate))
+    return socket.create_connection((addresses[0], port), timeout, source_address)
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        http.client.HTTPConnection.__init__(self, *args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        http.client.HTTPSConnection.__init__(self, *args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    # A 3xx is returned as an HTTPError instead of followed.
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), _PublicHTTPHandler,
+                                      _PublicHTTPSHandler, _NoRedirects)
+
+
+class ImageProxy:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        # Bytes in the cache directory as last counted plus what this
+        # process has written since; other processes' writes are picked up
+        # at the next count.
+        self._size = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_CACHE_DIR', os.path.join(app.instance_path, 'images'))
+        app.config.setdefault('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+        app.config.setdefault('IMAGE_FETCH_TIMEOUT', 5)
+        app.config.setdefault('IMAGE_MAX_SOURCE_BYTES', 20 * 1024 * 1024)
+        app.config.setdefault('IMAGE_FIXTURE_DIR', None)
+        self.app = app
+        app.add_url_rule('/images/<kind>/<int:entity_id>/<size>', 'image', self.send)
+        app.jinja_env.globals['image_url'] = self.url
+
+    @property
+    def directory(self):
+        return self.app.config['IMAGE_CACHE_DIR']
+
+    def url(self, kind, entity_id, link, size='tile'):
+        # Template helper: the proxied URL for an image_link, or the link
+        # itself when there is nothing to proxy.
+        if not link or not entity_id:
+            return link
+        return url_for('image', kind=kind, entity_id=entity_id, size=size, v=version(link))
+
+    #  Disk cache
+    #  ----------------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read(self, name):
+        path = self._path(name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _write(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, self._path(name))
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data)
+            if self._size is None or self._size > self.app.config['IMAGE_CACHE_MAX_BYTES']:
+                self.prune()
+
+    def prune(self):
+        # Delete the least recently used files until the directory is back
+        # under 90% of the cap.
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.is_file() and not entry.name.endswith('.tmp')]
+        except OSError:
+            return
+        stats = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+        total = sum(size for _, size, _ in stats)
+        limit = self.app.config['IMAGE_CACHE_MAX_BYTES']
+        if total > limit:
+            for _, size, path in sorted(stats):
+                if total <= limit * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+        self._size = total
+
+    #  Sources
+    #  ----------------------------------------------------------------
+
+    def _fetch(self, link):
+        parts = urllib.parse.urlsplit(link)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError('Not an http(s) URL: {}'.format(link))
+        limit = self.app.config['IMAGE_MAX_SOURCE_BYTES']
+
+        fixtures = self.app.config['IMAGE_FIXTURE_DIR']
+        if fixtures:
+            path = os.path.normpath(os.path.join(fixtures, parts.hostname, parts.path.lstrip('/')))
+            if not path.startswith(os.path.abspath(fixtures) + os.sep):
+                raise ValueError('Fixture path outside {}'.format(fixtures))
+            with open(path, 'rb') as f:
+                return f.read(limit + 1)[:limit]
+
+        upstream = urllib.request.Request(link, headers={'User-Agent': 'fyyur-image-proxy'})
+        with _opener.open(upstream, timeout=self.app.config['IMAGE_FETCH_TIMEOUT']) as response:
+            data = response.read(limit + 1)
+        if len(data) > limit:
+            raise ValueError('Image larger than {} bytes: {}'.format(limit, link))
+        return data
+
+    def _original(self, kind, entity_id, key):
+        data = self._read(key + '.orig')
+        if data is not None:
+            return data
+        model = KINDS[kind]
+        link = db.session.query(model.image_link).filter(model.id == entity_id).scalar()
+        if not link or version(link) != key:
+            abort(404)
+        data = self._fetch(link)
+        self._write(key + '.orig', data)
+        return data
+
+    #  Rendering
+    #  ----------------------------------------------------------------
+
+    @staticmethod
+    def _render(data, box, webp):
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail(box)
+        transparent = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        output = io.BytesIO()
+        if webp:
+            image.save(output, 'WEBP', quality=80, method=4)
+            return output.getvalue(), 'image/webp'
+        if transparent:
+            image.save(output, 'PNG', optimize=True)
+            return output.getvalue(), 'image/png'
+        image.convert('RGB').save(output, 'JPEG', quality=82, optimize=True, progressive=True)
+        return output.getvalue(), 'image/jpeg'
+
+    @staticmethod
+    def _name(key, size, webp):
+        return '{}-{}.{}'.format(key, size, 'webp' if webp else 'img')
+
+    def warm(self, kind, entity_id):
+        # Fetch the image and render every size and format ahead of the
+        # first request for them; run from the job queue after an edit.
+        model = KINDS[kind]
+        link = db.session.query(model.image_link).filter(model.id == entity_id).scalar()
+        if not link:
+            return
+        key = version(link)
+        original = self._original(kind, entity_id, key)
+        if Image is None:
+            return
+        try:
+            for size, box in SIZES.items():
+                for webp in (True, False):
+                    name = self._name(key, size, webp)
+                    if not os.path.exists(self._path(name)):
+                        self._write(name, self._render(original, box, webp)[0])
+        except _IMAGE_ERRORS as e:
+            # Retrying cannot fix a file that is not a usable image.
+            logger.warning('Image %s/%s not rendered: %s', kind, entity_id, e)
+
+    def send(self, kind, entity_id, size):
+        key = request.args.get('v', '')
+        if kind not in KINDS or size not in SIZES or not _VERSION.fullmatch(key):
+            abort(404)
+        webp = Image is not None and 'image/webp' in request.accept_mimetypes.values()
+        name = self._name(key, size, webp)
+
+        data = self._read(name)
+        mimetype = None
+        if data is None:
+            try:
+                original = self._original(kind, entity_id, key)
+                if Image is None:
+                    if _sniff(original) == 'application/octet-stream':
+                        raise ValueError('Not a recognised image')
+                    data = original
+                else:
+                    data, mimetype = self._render(original, SIZES[size], webp)
+                    self._write(name, data)
+            except _IMAGE_ERRORS as e:
+                # The page still gets an image: the original, uncached.
+                logger.warning('Image %s/%s unavailable: %s', kind, entity_id, e)
+                link = db.session.query(KINDS[kind].image_link).filter(KINDS[kind].id == entity_id).scalar()
+                if not link:
+                    abort(404)
+                return redirect(link)
+
+        response = send_file(io.BytesIO(data), mimetype=mimetype or _sniff(data), max_age=ONE_YEAR)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept')
+        return response
+
+
+def _sniff(data):
+    if data.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    return 'application/octet-stream'
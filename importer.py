@@ -0,0 +1,249 @@
+import csv
+import io
+import json
+import dateutil.parser
+from werkzeug.datastructures import MultiDict
+from wtforms import BooleanField, SelectMultipleField
+from wtforms.fields.core import UnboundField
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Show, touch
+import bookings
+import counters
+import directory
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# Streams venues, artists or shows from CSV or NDJSON into the database.
+# Rows use the field names of the create forms (website_link, genres,
+# seeking_talent, ...) and are validated by those same forms, so an import
+# accepts exactly what the create pages accept. In CSV, genres are
+# separated by commas within their cell.
+#
+# Valid rows are inserted with executemany and committed every batch_size
+# rows; a rejected row never holds up the rest of the file. Rows are read
+# one at a time and each batch is dropped once committed, so memory use
+# does not grow with the size of the file.
+
+FORMATS = ('csv', 'ndjson')
+DEFAULT_BATCH_SIZE = 1000
+
+_FALSE = {'', '0', 'false', 'f', 'no', 'n', 'off'}
+
+
+def guess_format(filename):
+    return 'csv' if filename.lower().endswith('.csv') else 'ndjson'
+
+
+def read_rows(stream, format):
+    # Yield (line, row, error) for each record in a text stream. row is a
+    # dict of strings, lists and booleans; error is set instead when the
+    # record cannot be parsed at all.
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as e:
+            yield line, None, 'Not valid JSON: {}'.format(e)
+            continue
+        if not isinstance(row, dict):
+            yield line, None, 'Expected a JSON object'
+            continue
+        yield line, row, None
+
+
+def text_stream(binary):
+    # Decode a binary stream (an upload, request.stream or stdin) lazily.
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def _formdata(form_class, row):
+    # Turn a parsed row into the MultiDict a form would get from a POST:
+    # lists become repeated keys, false booleans are left out.
+    data = MultiDict()
+    for name, value in row.items():
+        field = getattr(form_class, name, None)
+        if not isinstance(field, UnboundField) or value is None:
+            continue
+        if isinstance(value, str) and issubclass(field.field_class, SelectMultipleField):
+            value = [part.strip() for part in value.split(',') if part.strip()]
+        if issubclass(field.field_class, BooleanField):
+            if value is False or str(value).strip().lower() in _FALSE:
+                continue
+            value = 'y'
+        for item in value if isinstance(value, list) else [value]:
+            data.add(name, str(item))
+    return data
+
+
+def _validate(form_class, row):
+    form = form_class(formdata=_formdata(form_class, row))
+    if form.validate():
+        return form, None
+    return None, form.errors
+
+
+def _venue(form):
+    return {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'address': form.address.data,
+        'phone': form.phone.data,
+        'image_link': form.image_link.data or None,
+        'facebook_link': form.facebook_link.data,
+        'genres': form.genres.data,
+        'website': form.website_link.data or None,
+        'seeking_talent': form.seeking_talent.data,
+        'seeking_description': form.seeking_description.data or None,
+        'num_upcoming_shows': 0,
+        'venue_past_shows': 0,
+    }
+
+
+def _artist(form):
+    return {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'phone': form.phone.data,
+        'genres': form.genres.data,
+        'image_link': form.image_link.data or None,
+        'facebook_link': form.facebook_link.data,
+        'website': form.website_link.data or None,
+        'seeking_venue': form.seeking_venue.data,
+        'seeking_description': form.seeking_description.data or None,
+        'artist_past_shows': 0,
+        'num_upcoming_shows': 0,
+    }
+
+
+def _show_row(row):
+    # Start times are parsed leniently, as create_show_submission does,
+    # then handed to ShowForm in the format its DateTimeField expects.
+    row = dict(row)
+    if not row.get('start_time'):
+        # ShowForm would fall back to its default of today.
+        return None, {'start_time': ['This field is required.']}
+    try:
+        start = dateutil.parser.parse(str(row['start_time']))
+    except (ValueError, OverflowError):
+        return None, {'start_time': ['Not a valid datetime value.']}
+    row['start_time'] = start.strftime('%Y-%m-%d %H:%M:%S')
+
+    form, errors = _validate(ShowForm, row)
+    if errors:
+        return None, errors
+    errors = {}
+    ids = {}
+    for name in ('venue_id', 'artist_id'):
+        try:
+            ids[name] = int(getattr(form, name).data)
+        except (TypeError, ValueError):
+            errors[name] = ['Must be a whole number.']
+    if errors:
+        return None, errors
+    start = form.start_time.data
+    return dict(ids, start_time=start, end_time=start + bookings.parse_duration(form.duration.data)), None
+
+
+def _venue_row(row):
+    form, errors = _validate(VenueForm, row)
+    return (_venue(form), None) if form else (None, errors)
+
+
+def _artist_row(row):
+    form, errors = _validate(ArtistForm, row)
+    return (_artist(form), None) if form else (None, errors)
+
+
+KINDS = {
+    'venues': (Venue, _venue_row),
+    'artists': (Artist, _artist_row),
+    'shows': (Show, _show_row),
+}
+
+
+def _missing_references(batch):
+    # Shows whose venue or artist does not exist, found with one query per
+    # table for the whole batch rather than one per row.
+    missing = {}
+    for model, name in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        wanted = {row[name] for _, row in batch}
+        found = {row[0] for row in db.session.query(model.id).filter(model.id.in_(wanted))}
+        for line, row in batch:
+            if row[name] not in found:
+                missing.setdefault(line, {})[name] = ['No {} with id {}.'.format(model.__tablename__.lower(), row[name])]
+    return missing
+
+
+def _flush(kind, batch, on_reject, on_commit):
+    model = KINDS[kind][0]
+    if kind == 'shows':
+        missing = _missing_references(batch)
+        batch = [(line, row) for line, row in batch if line not in missing]
+        missing.update(bookings.check_batch(batch))
+        for line in sorted(missing):
+            on_reject(line, missing[line])
+        batch = [(line, row) for line, row in batch if line not in missing]
+    rows = [row for _, row in batch]
+    if not rows:
+        return 0
+
+    if kind == 'shows':
+        counters.record_shows(rows)
+    db.session.execute(model.__table__.insert(), rows)
+    if kind == 'venues':
+        directory.refresh_areas((row['state'], row['city']) for row in rows)
+    elif kind == 'shows':
+        directory.refresh_venues({row['venue_id'] for row in rows})
+    # Core inserts skip the before_flush hook in models.py.
+    touch(db.session, *(['Show', 'Venue', 'Artist'] if kind == 'shows' else [model.__tablename__]))
+    db.session.commit()
+    if on_commit:
+        on_commit(kind, rows)
+    return len(rows)
+
+
+def run_import(kind, records, batch_size=DEFAULT_BATCH_SIZE, on_reject=None, on_commit=None):
+    # Import (line, row, error) records from read_rows. on_reject(line,
+    # errors) is called for every rejected row, on_commit(kind, rows) after
+    # every committed batch. Returns (inserted, rejected).
+    validate = KINDS[kind][1]
+    on_reject = on_reject or (lambda line, errors: None)
+    inserted = rejected = 0
+    batch = []
+
+    def reject(line, errors):
+        nonlocal rejected
+        rejected += 1
+        on_reject(line, errors)
+
+    for line, row, error in records:
+        if error:
+            reject(line, {'': [error]})
+            continue
+        values, errors = validate(row)
+        if errors:
+            reject(line, errors)
+            continue
+        batch.append((line, values))
+        if len(batch) >= batch_size:
+            inserted += _flush(kind, batch, reject, on_commit)
+            batch = []
+    if batch:
+        inserted += _flush(kind, batch, reject, on_commit)
+    return inserted, rejected
+
+
+def format_errors(errors):
+    return '; '.join('{}: {}'.format(name, ' '.join(messages)) if name else ' '.join(messages)
+                     for name, messages in errors.items())
@@ -0,0 +1,80 @@
+import logging
+import os
+import threading
+import time
+
+#----------------------------------------------------------------------------#
+# In-memory indexes.
+#----------------------------------------------------------------------------#
+
+# Shared lifecycle of the indexes that answer queries from process memory
+# (typeahead.py, facets.py, matchmaking.py). A subclass implements build(),
+# which reads the database and swaps in the new data under self._lock,
+# setting built_at; the write handlers in app.py keep it current between
+# builds.
+#
+# An index is loaded on the first request. Other processes' writes (and
+# bulk imports) are picked up by a background rebuild when the index is
+# older than max_age seconds, or when request_rebuild() has touched the
+# stamp file since it was built. Queries keep using the old data while the
+# rebuild runs.
+
+logger = logging.getLogger('fyyur.indexes')
+
+
+class RebuildableIndex:
+    # Used in log messages, e.g. 'Facet index for venues'.
+    label = 'Index'
+
+    def __init__(self, max_age=300, stamp_path=None, lock=None):
+        self.max_age = max_age
+        self.stamp_path = stamp_path
+        self._lock = lock or threading.Lock()
+        self._rebuilding = False
+        self.built_at = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def load(self):
+        # Called on the first request; a failed build leaves the index
+        # empty and stale, so the next refresh tries again.
+        try:
+            self.build()
+        except Exception:
+            logger.exception('%s not built', self.label)
+
+    def is_stale(self):
+        if self.built_at is None:
+            return True
+        if self.max_age and time.time() - self.built_at > self.max_age:
+            return True
+        try:
+            return os.path.getmtime(self.stamp_path) > self.built_at
+        except (OSError, TypeError):
+            return False
+
+    def refresh_in_background(self, app):
+        # Rebuild in a thread when stale; queries keep using the old index.
+        with self._lock:
+            if self._rebuilding or not self.is_stale():
+                return
+            self._rebuilding = True
+
+        def run():
+            try:
+                with app.app_context():
+                    self.build()
+            except Exception:
+                logger.exception('%s rebuild failed', self.label)
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def request_rebuild(self):
+        # Ask every process to rebuild, via the stamp file.
+        if self.stamp_path:
+            os.makedirs(os.path.dirname(self.stamp_path), exist_ok=True)
+            with open(self.stamp_path, 'a'):
+                os.utime(self.stamp_path)
@@ -0,0 +1,231 @@
+import datetime
+import logging
+import random
+import threading
+import time
+from sqlalchemy import and_, delete, func, or_, update
+from sqlalchemy.dialects import postgresql
+from models import db, Job
+
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# Follow-on work that a write handler should not wait for is registered as
+# a task and queued with defer(). Jobs are rows in the Job table, inserted
+# in the handler's own transaction, so a job exists exactly when the write
+# it belongs to was committed. `flask worker` runs them on a pool of
+# threads:
+#
+#   @jobs.task('warm-images')
+#   def warm_images(kind, entity_id): ...
+#
+#   jobs.defer('warm-images', 'venue', venue.id, key='venue:{}'.format(venue.id))
+#   db.session.commit()
+#
+# Tasks work on the current session and leave the commit to the worker,
+# like the functions in counters.py. A job is deleted once its task
+# returns. A task that raises is retried after JOBS_RETRY_DELAY seconds,
+# doubled on every attempt up to JOBS_MAX_RETRY_DELAY, and is kept with
+# failed_at set after JOBS_MAX_ATTEMPTS. A worker that dies mid-job
+# leaves it locked for JOBS_LOCK_SECONDS, after which another worker
+# takes it.
+#
+# key deduplicates: while a job with the same task and key is still
+# waiting, deferring another one does nothing. Once a worker has started
+# it, a new job is queued, since the running one may have read the old
+# data.
+#
+# With JOBS_ENABLED off, defer() runs the task on the spot instead.
+
+logger = logging.getLogger('fyyur.jobs')
+
+
+def _insert_ignore(table):
+    dialect = db.session.connection().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return table.insert()
+
+
+def _unclaimed(now):
+    return or_(Job.locked_until.is_(None), Job.locked_until < now)
+
+
+class JobQueue:
+    def __init__(self, app=None):
+        self.tasks = {}
+        # What this process's workers have done, for stats().
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.total_latency = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_ENABLED', True)
+        app.config.setdefault('JOBS_MAX_ATTEMPTS', 5)
+        app.config.setdefault('JOBS_RETRY_DELAY', 10)
+        app.config.setdefault('JOBS_MAX_RETRY_DELAY', 3600)
+        app.config.setdefault('JOBS_LOCK_SECONDS', 300)
+        self.app = app
+        app.extensions['jobs'] = self
+
+    def task(self, name):
+        def decorator(function):
+            self.tasks[name] = function
+            return function
+        return decorator
+
+    def defer(self, name, *args, key=None, delay=0):
+        # Queue name(*args) in the current transaction; the caller commits.
+        if name not in self.tasks:
+            raise KeyError('Unknown task {!r}'.format(name))
+        if not self.app.config['JOBS_ENABLED']:
+            try:
+                self.tasks[name](*args)
+            except Exception:
+                logger.exception('Task %s%r failed', name, args)
+            return
+
+        now = datetime.datetime.now()
+        statement = _insert_ignore(Job.__table__) if key is not None else Job.__table__.insert()
+        db.session.execute(statement.values(
+            task=name,
+            args=list(args),
+            pending_key='{}:{}'.format(name, key) if key is not None else None,
+            created_at=now,
+            run_at=now + datetime.timedelta(seconds=delay),
+            attempts=0
+        ))
+
+    #  Worker
+    #  ----------------------------------------------------------------
+
+    def _claim(self):
+        # Lock the next ready job for this worker and commit, so other
+        # workers skip it. Returns None when nothing is ready.
+        now = datetime.datetime.now()
+        ready = and_(Job.failed_at.is_(None), Job.run_at <= now, _unclaimed(now))
+        candidate = db.session.query(Job.id).filter(ready) \
+            .order_by(Job.run_at) \
+            .limit(1) \
+            .with_for_update(skip_locked=True) \
+            .first()
+        if candidate is None:
+            db.session.commit()
+            return None
+        lock = datetime.timedelta(seconds=self.app.config['JOBS_LOCK_SECONDS'])
+        db.session.execute(
+            update(Job).where(Job.id == candidate.id)
+            .values(locked_until=now + lock, pending_key=None, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False))
+        job = db.session.query(Job.id, Job.task, Job.args, Job.attempts, Job.run_at) \
+            .filter(Job.id == candidate.id).one()
+        db.session.commit()
+        return job
+
+    def _run(self, job):
+        started = datetime.datetime.now()
+        try:
+            if job.task not in self.tasks:
+                raise KeyError('Unknown task {!r}'.format(job.task))
+            self.tasks[job.task](*job.args)
+            db.session.execute(delete(Job).where(Job.id == job.id).execution_options(synchronize_session=False))
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            self._retry(job, error)
+        with self._lock:
+            self.processed += 1
+            self.total_latency += (started - job.run_at).total_seconds()
+
+    def _retry(self, job, error):
+        config = self.app.config
+        now = datetime.datetime.now()
+        values = {'locked_until': None, 'last_error': '{}: {}'.format(type(error).__name__, error)}
+        if job.attempts >= config['JOBS_MAX_ATTEMPTS']:
+            logger.exception('Job %d (%s) failed after %d attempts', job.id, job.task, job.attempts)
+            values['failed_at'] = now
+            with self._lock:
+                self.failed += 1
+        else:
+            delay = min(config['JOBS_RETRY_DELAY'] * 2 ** (job.attempts - 1), config['JOBS_MAX_RETRY_DELAY'])
+            # Jitter keeps jobs that failed together from retrying together.
+            delay *= random.uniform(1, 1.25)
+            logger.warning('Job %d (%s) attempt %d failed, retrying in %.0fs: %s',
+                           job.id, job.task, job.attempts, delay, error)
+            values['run_at'] = now + datetime.timedelta(seconds=delay)
+            with self._lock:
+                self.retried += 1
+        db.session.execute(update(Job).where(Job.id == job.id).values(**values)
+                           .execution_options(synchronize_session=False))
+        db.session.commit()
+
+    def work(self, threads=4, poll=1.0, burst=False):
+        # Run jobs on `threads` threads until interrupted or, with burst,
+        # until no job is ready. Each job gets its own app context and so
+        # its own session.
+        stop = threading.Event()
+
+        def loop():
+            while not stop.is_set():
+                try:
+                    with self.app.app_context():
+                        job = self._claim()
+                        if job is not None:
+                            self._run(job)
+                            continue
+                except Exception:
+                    logger.exception('Worker error')
+                if burst:
+                    return
+                stop.wait(poll)
+
+        workers = [threading.Thread(target=loop, daemon=True) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        reported = time.time()
+        try:
+            while any(worker.is_alive() for worker in workers):
+                for worker in workers:
+                    worker.join(poll)
+                if time.time() - reported >= 60:
+                    reported = time.time()
+                    with self.app.app_context():
+                        logger.info('Jobs: %r', self.stats())
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+    #  Metrics
+    #  ----------------------------------------------------------------
+
+    def stats(self):
+        # Queue depth per task, how long the oldest ready job has waited,
+        # and what this process's workers have done so far.
+        now = datetime.datetime.now()
+        waiting = db.session.query(Job.task, func.count(Job.id)) \
+            .filter(Job.failed_at.is_(None), _unclaimed(now)) \
+            .group_by(Job.task) \
+            .all()
+        oldest = db.session.query(func.min(Job.run_at)) \
+            .filter(Job.failed_at.is_(None), Job.run_at <= now, _unclaimed(now)) \
+            .scalar()
+        running = db.session.query(func.count(Job.id)).filter(Job.locked_until >= now).scalar()
+        failed = db.session.query(func.count(Job.id)).filter(Job.failed_at.isnot(None)).scalar()
+        return {
+            'enabled': self.app.config['JOBS_ENABLED'],
+            'depth': sum(count for _, count in waiting),
+            'depth_by_task': dict(waiting),
+            'oldest_ready_seconds': (now - oldest).total_seconds() if oldest else 0,
+            'running': running,
+            'failed': failed,
+            'processed': self.processed,
+            'retried': self.retried,
+            'gave_up': self.failed,
+            'mean_latency_seconds': self.total_latency / self.processed if self.processed else None,
+        }
@@ -0,0 +1,288 @@
+import datetime
+import heapq
+import logging
+import math
+import time
+from sqlalchemy import func
+from forms import VenueForm
+from indexes import RebuildableIndex
+from models import db, Venue, Artist, Show
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#----------------------------------------------------------------------------#
+# Matchmaking.
+#----------------------------------------------------------------------------#
+
+# Ranks the artists for a venue, or the venues for an artist. Every
+# candidate gets a score from four features:
+#
+#   genre      share of the asker's genres the candidate also has
+#   city       1 in the same city and state, state 1 in the same state
+#   activity   shows in the last activity_days, log-scaled to 0..1
+#   available  1 when the candidate is seeking (seeking_talent for
+#              venues, seeking_venue for artists)
+#
+# weighted by WEIGHTS (or MATCH_WEIGHTS) and summed.
+#
+# One MatchIndex per kind holds its candidates' features in memory, one
+# row per venue or artist: a one-hot genre matrix over the genre choices
+# in forms.py and a column per other feature. With NumPy installed a query
+# is a matrix-vector product, a few column comparisons and a partial sort,
+# a few milliseconds for 100k candidates. Without it the same scores are
+# computed row by row, which takes about a hundred times longer.
+#
+# The index is loaded, kept current and rebuilt like the other in-memory
+# indexes, see indexes.py; the periodic rebuild also lets old shows age out
+# of activity, and bulk imports touch its stamp file.
+
+logger = logging.getLogger('fyyur.matchmaking')
+
+KINDS = {
+    'venue': (Venue, Venue.seeking_talent, Show.venue_id),
+    'artist': (Artist, Artist.seeking_venue, Show.artist_id),
+}
+
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+STATES = [value for value, _ in VenueForm.state.kwargs['choices']]
+_GENRE_INDEX = {genre: index for index, genre in enumerate(GENRES)}
+_STATE_INDEX = {state: index for index, state in enumerate(STATES)}
+
+WEIGHTS = {
+    'genre': 4.0,
+    'city': 2.0,
+    'state': 1.0,
+    'activity': 1.0,
+    'available': 2.0,
+}
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+# Attributes replaced together when the index is rebuilt.
+_STATE = ('_rows', '_free', '_size', '_capacity', '_cities', '_ids', '_genres',
+          '_states', '_city_ids', '_activity', '_available', '_alive')
+
+
+def _one_hot(genres):
+    row = [0.0] * len(GENRES)
+    for genre in genres or ():
+        index = _GENRE_INDEX.get(genre)
+        if index is not None:
+            row[index] = 1.0
+    return row
+
+
+def _city_key(city, state):
+    return ((city or '').strip().lower(), state)
+
+
+class MatchIndex(RebuildableIndex):
+    def __init__(self, kind, max_age=300, stamp_path=None, weights=None, activity_days=365):
+        RebuildableIndex.__init__(self, max_age, stamp_path)
+        self.kind = kind
+        self.label = 'Match index for {}s'.format(kind)
+        self.weights = dict(WEIGHTS, **(weights or {}))
+        self.activity_days = activity_days
+        self._cities = {}
+        self._reset(0)
+
+    @classmethod
+    def from_config(cls, kind, config):
+        return cls(kind, config.get('MATCH_MAX_AGE', 300), config.get('MATCH_STAMP'),
+                   config.get('MATCH_WEIGHTS'), config.get('MATCH_ACTIVITY_DAYS', 365))
+
+    def __len__(self):
+        return len(self._rows)
+
+    #  Storage
+    #  ----------------------------------------------------------------
+
+    # Rows are appended and never moved; a deleted venue or artist leaves
+    # a dead row that the next put reuses. Columns grow by doubling.
+
+    def _reset(self, capacity):
+        self._rows = {}
+        self._free = []
+        self._size = 0
+        self._capacity = capacity
+        if numpy is not None:
+            self._ids = numpy.full(capacity, -1, dtype=numpy.int64)
+            self._genres = numpy.zeros((capacity, len(GENRES)), dtype=numpy.float32)
+            self._states = numpy.full(capacity, -1, dtype=numpy.int16)
+            self._city_ids = numpy.full(capacity, -1, dtype=numpy.int32)
+            self._activity = numpy.zeros(capacity, dtype=numpy.float32)
+            self._available = numpy.zeros(capacity, dtype=numpy.float32)
+            self._alive = numpy.zeros(capacity, dtype=bool)
+        else:
+            self._ids = [-1] * capacity
+            self._genres = [None] * capacity
+            self._states = [-1] * capacity
+            self._city_ids = [-1] * capacity
+            self._activity = [0.0] * capacity
+            self._available = [0.0] * capacity
+            self._alive = [False] * capacity
+
+    def _grow(self):
+        capacity = max(1024, self._capacity * 2)
+        extra = capacity - self._capacity
+        if numpy is not None:
+            self._ids = numpy.concatenate([self._ids, numpy.full(extra, -1, dtype=numpy.int64)])
+            self._genres = numpy.concatenate([self._genres, numpy.zeros((extra, len(GENRES)), dtype=numpy.float32)])
+            self._states = numpy.concatenate([self._states, numpy.full(extra, -1, dtype=numpy.int16)])
+            self._city_ids = numpy.concatenate([self._city_ids, numpy.full(extra, -1, dtype=numpy.int32)])
+            self._activity = numpy.concatenate([self._activity, numpy.zeros(extra, dtype=numpy.float32)])
+            self._available = numpy.concatenate([self._available, numpy.zeros(extra, dtype=numpy.float32)])
+            self._alive = numpy.concatenate([self._alive, numpy.zeros(extra, dtype=bool)])
+        else:
+            self._ids.extend([-1] * extra)
+            self._genres.extend([None] * extra)
+            self._states.extend([-1] * extra)
+            self._city_ids.extend([-1] * extra)
+            self._activity.extend([0.0] * extra)
+            self._available.extend([0.0] * extra)
+            self._alive.extend([False] * extra)
+        self._capacity = capacity
+
+    def _city_id(self, city, state):
+        return self._cities.setdefault(_city_key(city, state), len(self._cities))
+
+    def _set(self, entity_id, genres, city, state, seeking, activity=None):
+        row = self._rows.get(entity_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = self._size
+                if row == self._capacity:
+                    self._grow()
+                self._size += 1
+            self._rows[entity_id] = row
+            self._ids[row] = entity_id
+            self._activity[row] = 0.0
+        self._genres[row] = _one_hot(genres)
+        self._states[row] = _STATE_INDEX.get(state, -1)
+        self._city_ids[row] = self._city_id(city, state)
+        self._available[row] = 1.0 if seeking else 0.0
+        self._alive[row] = True
+        if activity is not None:
+            self._activity[row] = activity
+
+    #  Updates
+    #  ----------------------------------------------------------------
+
+    def build(self):
+        started = time.time()
+        model, seeking, fk = KINDS[self.kind]
+        since = datetime.datetime.now() - datetime.timedelta(days=self.activity_days)
+        activity = dict(db.session.query(fk, func.count(Show.id))
+                        .filter(Show.start_time >= since)
+                        .group_by(fk))
+        rows = db.session.query(model.id, model.genres, model.city, model.state, seeking).all()
+        # Filled outside the lock so queries keep being answered meanwhile.
+        fresh = MatchIndex(self.kind)
+        fresh._reset(max(1024, len(rows)))
+        for entity_id, genres, city, state, is_seeking in rows:
+            fresh._set(entity_id, genres, city, state, is_seeking, activity.get(entity_id, 0))
+        with self._lock:
+            for name in _STATE:
+                setattr(self, name, getattr(fresh, name))
+            self.built_at = started
+        logger.info('Match index for %ss built: %d rows in %.2fs', self.kind, len(rows), time.time() - started)
+
+    def put(self, entity_id, genres, city, state, seeking):
+        # Add or update one venue or artist; its activity is kept.
+        with self._lock:
+            self._set(entity_id, genres, city, state, seeking)
+
+    def discard(self, entity_id):
+        with self._lock:
+            row = self._rows.pop(entity_id, None)
+            if row is not None:
+                self._alive[row] = False
+                self._ids[row] = -1
+                self._free.append(row)
+
+    def add_show(self, entity_id):
+        # Called when a show is booked for this venue or artist.
+        with self._lock:
+            row = self._rows.get(entity_id)
+            if row is not None:
+                self._activity[row] += 1
+
+    #  Queries
+    #  ----------------------------------------------------------------
+
+    def top(self, genres, city, state, limit=DEFAULT_LIMIT, seeking_only=False):
+        # [(id, score)] of the best `limit` candidates for an asker with
+        # these genres, city and state, best first.
+        limit = max(1, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
+        query = _one_hot(genres)
+        wanted = sum(query)
+        state_index = _STATE_INDEX.get(state, -2)
+        with self._lock:
+            city_id = self._cities.get(_city_key(city, state), -2)
+            if numpy is not None:
+                return self._top_numpy(query, wanted, city_id, state_index, limit, seeking_only)
+            return self._top_python(query, wanted, city_id, state_index, limit, seeking_only)
+
+    def _top_numpy(self, query, wanted, city_id, state_index, limit, seeking_only):
+        size = self._size
+        if not size:
+            return []
+        weights = self.weights
+        activity = self._activity[:size]
+        busiest = activity.max()
+        scores = self._genres[:size] @ numpy.asarray(query, dtype=numpy.float32)
+        scores *= weights['genre'] / max(wanted, 1)
+        scores += weights['city'] * (self._city_ids[:size] == city_id)
+        scores += weights['state'] * (self._states[:size] == state_index)
+        if busiest > 0:
+            scores += (weights['activity'] / math.log1p(busiest)) * numpy.log1p(activity)
+        scores += weights['available'] * self._available[:size]
+        live = self._alive[:size] & (self._available[:size] > 0) if seeking_only else self._alive[:size]
+        scores[~live] = -numpy.inf
+
+        count = min(limit, int(live.sum()))
+        if not count:
+            return []
+        # Every row scoring at least the count-th best, so that ties are
+        # broken by the newest id like the rest of the app, not by where
+        # argpartition happened to cut.
+        cutoff = scores[numpy.argpartition(-scores, count - 1)[count - 1]] if count < size else -numpy.inf
+        best = numpy.flatnonzero((scores >= cutoff) & live)
+        ids = self._ids[best]
+        order = numpy.lexsort((-ids, -scores[best]))[:count]
+        return [(int(ids[index]), round(float(scores[best[index]]), 4)) for index in order]
+
+    def _top_python(self, query, wanted, city_id, state_index, limit, seeking_only):
+        weights = self.weights
+        busiest = max(self._activity[:self._size], default=0)
+        genres = [index for index, value in enumerate(query) if value]
+        candidates = []
+        for row in range(self._size):
+            entity_id = self._ids[row]
+            if entity_id < 0 or (seeking_only and not self._available[row]):
+                continue
+            overlap = sum(self._genres[row][index] for index in genres)
+            score = weights['genre'] * overlap / max(wanted, 1) \
+                + weights['city'] * (self._city_ids[row] == city_id) \
+                + weights['state'] * (self._states[row] == state_index) \
+                + weights['available'] * self._available[row]
+            if busiest > 0:
+                score += weights['activity'] * math.log1p(self._activity[row]) / math.log1p(busiest)
+            candidates.append((score, entity_id))
+        return [(entity_id, round(score, 4)) for score, entity_id in heapq.nlargest(limit, candidates)]
+
+    def stats(self):
+        return {
+            'rows': len(self._rows),
+            'capacity': self._capacity,
+            'cities': len(self._cities),
+            'numpy': numpy is not None,
+            'built_at': self.built_at,
+            'rebuilding': self._rebuilding,
+        }
@@ -0,0 +1,35 @@
+"""trigram indexes for venue and artist name search
+
+Revision ID: 9e62f5a1c3d8
+Revises: 4b1d0c2e9a71
+Create Date: 2026-10-18 10:03:27.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e62f5a1c3d8'
+down_revision = '4b1d0c2e9a71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm GIN indexes serve ILIKE '%term%' and similarity() ranking.
+    # Other databases fall back to a plain ILIKE, see search.py.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_Venue_name_trgm', table_name='Venue')
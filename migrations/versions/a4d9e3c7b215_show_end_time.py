@@ -0,0 +1,60 @@
+"""Show end_time and no double-booking of venues or artists
+
+Revision ID: a4d9e3c7b215
+Revises: f81c4a6e2d37
+Create Date: 2026-10-18 21:14:08.337152
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d9e3c7b215'
+down_revision = 'f81c4a6e2d37'
+branch_labels = None
+depends_on = None
+
+CONSTRAINTS = [
+    ('ex_Show_venue_booking', 'venue_id'),
+    ('ex_Show_artist_booking', 'artist_id'),
+]
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+
+    # Existing shows get the default two hours, cut short where the venue
+    # or artist has a later show starting sooner, so they satisfy the
+    # constraints below. Shows that started at the same time end up with
+    # an empty range, which overlaps nothing.
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    op.execute('UPDATE "Show" SET end_time = {}'.format(
+        "start_time + interval '2 hours'" if postgresql else
+        # Keep SQLAlchemy's text format, fractional seconds included.
+        "strftime('%Y-%m-%d %H:%M:%S', start_time, '+2 hours') || substr(start_time, 20)"))
+    for _, column in CONSTRAINTS:
+        op.execute(
+            'UPDATE "Show" SET end_time = later.next_start '
+            'FROM (SELECT id, lead(start_time) OVER (PARTITION BY {column} ORDER BY start_time, id) AS next_start '
+            'FROM "Show") AS later '
+            'WHERE later.id = "Show".id AND later.next_start < "Show".end_time'.format(column=column))
+
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+
+    if not postgresql:
+        return
+    # Equality on an integer inside a GiST index needs btree_gist.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, column in CONSTRAINTS:
+        op.execute('ALTER TABLE "Show" ADD CONSTRAINT "{}" EXCLUDE USING gist '
+                   '({} WITH =, tsrange(start_time, end_time) WITH &&)'.format(name, column))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for name, _ in reversed(CONSTRAINTS):
+            op.drop_constraint(name, 'Show')
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('end_time')
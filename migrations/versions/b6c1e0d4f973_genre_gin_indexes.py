@@ -0,0 +1,43 @@
+"""GIN indexes on venue and artist genres
+
+Revision ID: b6c1e0d4f973
+Revises: a4d9e3c7b215
+Create Date: 2026-10-18 23:41:08.327145
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6c1e0d4f973'
+down_revision = 'a4d9e3c7b215'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_Venue_genres_gin', 'Venue'),
+    ('ix_Artist_genres_gin', 'Artist'),
+]
+
+
+def upgrade():
+    # genres @> ARRAY[...] filters (the availability search, and any
+    # genre query that cannot go through the in-memory facet index of
+    # facets.py) use these instead of scanning the table. Built
+    # CONCURRENTLY like d3f0a6b18e42. SQLite stores genres as text and has
+    # no equivalent.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.create_index(name, table, ['genres'], unique=False,
+                            postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for name, table in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
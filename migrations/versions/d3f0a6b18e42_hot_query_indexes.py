@@ -0,0 +1,43 @@
+"""indexes for the listing, detail page and rollover queries
+
+Revision ID: d3f0a6b18e42
+Revises: c7a4e81f2b95
+Create Date: 2026-10-18 18:12:44.205316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f0a6b18e42'
+down_revision = 'c7a4e81f2b95'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_Venue_state_city_name', 'Venue', ['state', 'city', 'name', 'id'], None),
+    ('ix_Artist_name_id', 'Artist', ['name', 'id'], None),
+    ('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], None),
+    ('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], None),
+    ('ix_Show_start_time_id', 'Show', ['start_time', 'id'], None),
+    ('ix_Show_upcoming_start_time', 'Show', ['start_time'], 'upcoming_show'),
+]
+
+
+def upgrade():
+    # Built CONCURRENTLY on PostgreSQL so the tables stay writable; that
+    # cannot run inside the migration's transaction. Case-insensitive
+    # name search is already served by the pg_trgm indexes of 9e62f5a1c3d8.
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True,
+                            postgresql_where=sa.text(where) if where else None,
+                            sqlite_where=sa.text(where) if where else None)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -1,6 +1,11 @@
-from flask_sqlalchemy import SQLAlchemy
+import datetime
+from itertools import chain
 from flask_migrate import Migrate
-db = SQLAlchemy()
+from sqlalchemy import DDL, event, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from replicas import RoutingSQLAlchemy
+db = RoutingSQLAlchemy()
 
 def dbConnect(app):
     app.config.from_object('config')
@@ -14,6 +19,15 @@ def dbConnect(app):
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # directory.py reads an area's venues in this order.
+        db.Index('ix_Venue_state_city_name', 'state', 'city', 'name', 'id'),
+        # Name search, see search.py.
+        db.Index('ix_Venue_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # genres @> ARRAY[...] filters.
+        db.Index('ix_Venue_genres_gin', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -32,10 +46,20 @@ class Venue(db.Model):
     seeking_description = db.Column(db.Text)
     num_upcoming_shows = db.Column(db.Integer, default=0)
     venue_past_shows = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.now, onupdate=datetime.datetime.now)
     shows = db.relationship('Show', backref='venue', lazy=True, cascade="save-update, merge, delete")
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        # The /artists listing walks artists in this order.
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+        # Name search, see search.py.
+        db.Index('ix_Artist_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # genres @> ARRAY[...] filters.
+        db.Index('ix_Artist_genres_gin', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -53,15 +77,152 @@ class Artist(db.Model):
     seeking_description = db.Column(db.Text)
     artist_past_shows = db.Column(db.Integer, default=0)
     num_upcoming_shows = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.now, onupdate=datetime.datetime.now)
     shows = db.relationship('Show', backref='artist', lazy=True, cascade="save-update, merge, delete")
 
+
+# The name_trgm indexes need pg_trgm; create_all installs it first, as the
+# 9e62f5a1c3d8 migration does.
+for _table in (Venue.__table__, Artist.__table__):
+    event.listen(_table, 'before_create',
+                 DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
     
+# Length of a show when none is given.
+SHOW_DURATION = datetime.timedelta(hours=2)
+
+def _default_end_time(context):
+    return context.get_current_parameters()['start_time'] + SHOW_DURATION
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        # Detail pages and their watermarks: one venue's or artist's shows
+        # by start time.
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        # The /shows listing.
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        # rollover-shows only looks at shows still counted as upcoming.
+        db.Index('ix_Show_upcoming_start_time', 'start_time',
+                 postgresql_where=db.text('upcoming_show'), sqlite_where=db.text('upcoming_show')),
+        # No double-booking, see bookings.py.
+        postgresql.ExcludeConstraint(('venue_id', '='), (db.text('tsrange(start_time, end_time)'), '&&'),
+                                     name='ex_Show_venue_booking', using='gist'),
+        postgresql.ExcludeConstraint(('artist_id', '='), (db.text('tsrange(start_time, end_time)'), '&&'),
+                                     name='ex_Show_artist_booking', using='gist'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id') ,nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'),nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
-    upcoming_show = db.Column(db.Boolean, default=True)
\ No newline at end of file
+    # A show occupies its venue and artist until end_time; see bookings.py
+    # for the double-booking rules.
+    end_time = db.Column(db.DateTime, nullable=False, default=_default_end_time)
+    upcoming_show = db.Column(db.Boolean, default=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
+
+# Equality on an integer inside a GiST index needs btree_gist, which the
+# a4d9e3c7b215 migration also installs.
+event.listen(Show.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'))
+
+
+# The /venues directory, one row per (state, city) holding that area's
+# venues as [{"id", "name", "num_upcoming_shows"}, ...] in name order.
+# Derived from Venue and kept current by directory.py.
+class VenueArea(db.Model):
+    __tablename__ = 'VenueArea'
+
+    state = db.Column(db.String(120), primary_key=True)
+    city = db.Column(db.String(120), primary_key=True)
+    venues = db.Column(db.JSON, nullable=False)
+
+
+# Durable queue of background jobs; see jobs.py. pending_key is the
+# dedupe key of a job that has not started yet and is cleared once a
+# worker claims it.
+class Job(db.Model):
+    __tablename__ = 'Job'
+    __table_args__ = (
+        # Workers take ready jobs in run_at order.
+        db.Index('ix_Job_run_at', 'run_at',
+                 postgresql_where=db.text('failed_at IS NULL')),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    task = db.Column(db.String(64), nullable=False)
+    args = db.Column(db.JSON, nullable=False)
+    pending_key = db.Column(db.String(255), unique=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_until = db.Column(db.DateTime)
+    failed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+
+# Last write to each table, including deletes, which a max(updated_at)
+# over the table itself cannot see. Listing pages build their ETag from it.
+#
+# Writers only note which tables they touched. The rows are bumped once
+# the writing transaction has committed, each in its own short statement
+# and in table name order, so no transaction holds a watermark row while it
+# does other work and two writers never wait on each other's rows. A page
+# read between the commit and the bump carries the previous ETag, which at
+# worst costs a client one more revalidation.
+class Watermark(db.Model):
+    __tablename__ = 'Watermark'
+
+    table = db.Column(db.String(64), primary_key=True)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+
+def touch(session, *tables):
+    # Bump these tables' watermarks when the session's transaction commits.
+    session.info.setdefault('touched_tables', set()).update(tables)
+
+
+def _bump(connection, table, now):
+    # Upsert, so a missing row (a database made by create_all) is created
+    # without a read-then-insert race.
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql if dialect == 'postgresql' else sqlite).insert(Watermark.__table__) \
+            .values(table=table, updated_at=now)
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=['table'], set_={'updated_at': insert.excluded.updated_at}))
+    elif not connection.execute(update(Watermark.__table__)
+                                .where(Watermark.__table__.c.table == table)
+                                .values(updated_at=now)).rowcount:
+        connection.execute(Watermark.__table__.insert().values(table=table, updated_at=now))
+
+
+@event.listens_for(Session, 'before_flush')
+def touch_flushed_tables(session, flush_context, instances):
+    tables = {
+        obj.__tablename__ for obj in chain(session.new, session.dirty, session.deleted)
+        if not isinstance(obj, Watermark)
+    }
+    if tables:
+        touch(session, *tables)
+
+
+@event.listens_for(Session, 'after_commit')
+def bump_watermarks(session):
+    tables = session.info.pop('touched_tables', None)
+    if not tables:
+        return
+    now = datetime.datetime.now()
+    engine = session.get_bind()
+    for table in sorted(tables):
+        with engine.begin() as connection:
+            _bump(connection, table, now)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_touched_tables(session):
+    session.info.pop('touched_tables', None)
@@ -0,0 +1,68 @@
+import base64
+import datetime
+import json
+from flask import abort, request
+from sqlalchemy import literal, tuple_
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+# Pages are addressed by an opaque cursor holding the sort key of the last
+# row on the previous page, so fetching page N costs the same as page 1:
+# one indexed range scan of (page size + 1) rows, whatever N is.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values):
+    payload = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    # Raises ValueError for anything that is not a cursor we handed out.
+    padded = cursor + '=' * (-len(cursor) % 4)
+    values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('cursor does not match the sort key')
+    return [_decode_value(value) for value in values]
+
+
+def page_args():
+    # Cursor and page size from the query string; bad cursors are a 400.
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    return request.args.get('cursor'), max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, key, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    # query must select every column in key under its own name. Returns the
+    # rows of the page and the cursor of the next one (None on the last).
+    if cursor:
+        try:
+            values = decode_cursor(cursor, len(key))
+        except (ValueError, TypeError, KeyError):
+            abort(400)
+        bound = [literal(value, column.type) for column, value in zip(key, values)]
+        query = query.filter(tuple_(*key) > tuple_(*bound))
+
+    rows = query.order_by(*key).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, column.key) for column in key])
@@ -0,0 +1,242 @@
+from collections import namedtuple
+from sqlalchemy import and_, func, or_, select, type_coerce
+from sqlalchemy.dialects import postgresql
+from models import db, Venue, Artist, Show, VenueArea, Watermark
+from bookings import MAX_DURATION
+from pagination import DEFAULT_PAGE_SIZE, keyset_page
+
+#----------------------------------------------------------------------------#
+# Read queries.
+#----------------------------------------------------------------------------#
+
+# Column projections for the read-only pages. Each function selects just
+# the columns its template uses, joined in one statement, and returns
+# SQLAlchemy rows (named tuples) rather than ORM instances, so nothing is
+# added to the identity map and no lazy relationship load can fire while
+# the template renders.
+
+VENUE_DETAIL_COLUMNS = (
+    Venue.id,
+    Venue.name,
+    Venue.genres,
+    Venue.address,
+    Venue.city,
+    Venue.state,
+    Venue.phone,
+    Venue.website,
+    Venue.facebook_link,
+    Venue.seeking_talent,
+    Venue.seeking_description,
+    Venue.image_link,
+)
+
+ARTIST_DETAIL_COLUMNS = (
+    Artist.id,
+    Artist.name,
+    Artist.genres,
+    Artist.city,
+    Artist.state,
+    Artist.phone,
+    Artist.website,
+    Artist.facebook_link,
+    Artist.seeking_venue,
+    Artist.seeking_description,
+    Artist.image_link,
+)
+
+
+def venue_directory(cursor=None, limit=DEFAULT_PAGE_SIZE):
+    # Whole areas from the VenueArea read model (see directory.py), in
+    # primary key order; limit counts areas.
+    query = db.session.query(VenueArea.state, VenueArea.city, VenueArea.venues)
+    return keyset_page(query, (VenueArea.state, VenueArea.city), cursor, limit)
+
+
+def available_venues(start, end, city=None, state=None, genres=(), cursor=None, limit=DEFAULT_PAGE_SIZE):
+    # Venues with no show overlapping [start, end), optionally in one city
+    # and state and hosting every genre given, in directory order. Each
+    # candidate costs one probe of ix_Show_venue_id_start_time bounded by
+    # MAX_DURATION, the same check bookings.conflicts makes, and shows
+    # are read where they are written, so nothing needs refreshing.
+    booked = select(Show.id).where(
+        Show.venue_id == Venue.id,
+        Show.start_time > start - MAX_DURATION,
+        Show.start_time < end,
+        Show.end_time > start
+    ).exists()
+    query = db.session.query(
+        Venue.state,
+        Venue.city,
+        Venue.id,
+        Venue.name,
+        Venue.genres,
+        Venue.num_upcoming_shows
+    ).filter(~booked)
+    if state:
+        query = query.filter(Venue.state == state)
+    if city:
+        query = query.filter(Venue.city == city)
+    if genres:
+        # The model declares the generic ARRAY, which has no @> operator.
+        query = query.filter(type_coerce(Venue.genres, postgresql.ARRAY(db.String())).contains(list(genres)))
+    return keyset_page(query, (Venue.state, Venue.city, Venue.name, Venue.id), cursor, limit)
+
+
+def artist_listing(cursor=None, limit=DEFAULT_PAGE_SIZE):
+    query = db.session.query(Artist.id, Artist.name)
+    return keyset_page(query, (Artist.name, Artist.id), cursor, limit)
+
+
+def show_listing(cursor=None, limit=DEFAULT_PAGE_SIZE):
+    query = db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+      ).join(Venue, Venue.id == Show.venue_id) \
+      .join(Artist, Artist.id == Show.artist_id)
+    return keyset_page(query, (Show.start_time, Show.id), cursor, limit)
+
+
+def rows_by_id(entity, ids):
+    # id, name, city and state of the given venues or artists, in the
+    # order of ids. Ids deleted since they were looked up are left out.
+    rows = db.session.query(entity.id, entity.name, entity.city, entity.state) \
+        .filter(entity.id.in_(ids)) \
+        .all() if ids else []
+    by_id = {row.id: row for row in rows}
+    return [by_id[entity_id] for entity_id in ids if entity_id in by_id]
+
+
+def venue_artist_ids(venue_id):
+    # Artists with a show at the venue; their pages show its name.
+    return [artist_id for artist_id, in
+            db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+
+
+def artist_venue_ids(artist_id):
+    # Venues with a show by the artist; their pages show its name and image.
+    return [venue_id for venue_id, in
+            db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+
+def match_profile(entity, entity_id):
+    # genres, city and state of one venue or artist, None when missing.
+    return db.session.query(entity.genres, entity.city, entity.state) \
+        .filter(entity.id == entity_id) \
+        .first()
+
+
+VenueShow = namedtuple('VenueShow', 'artist_id artist_name artist_image_link start_time')
+ArtistShow = namedtuple('ArtistShow', 'venue_id venue_name venue_image_link start_time')
+
+
+def _page_with_shows(entity, columns, fk, other, other_fk, record, entity_id, now, past_limit):
+    # The entity's columns left-joined to all of its shows in one statement.
+    # Shows starting at or after `now` are upcoming, earlier ones are past.
+    # Past shows are ranked newest first so past_limit can cap what is
+    # loaded, and a scalar subquery keeps the real past show total.
+    is_past = Show.start_time < now
+    shows = db.session.query(
+        fk.label('owner_id'),
+        other.id.label('other_id'),
+        other.name.label('other_name'),
+        other.image_link.label('other_image_link'),
+        Show.start_time,
+        func.row_number().over(partition_by=is_past, order_by=Show.start_time.desc()).label('past_rank')
+      ).join(other, other.id == other_fk) \
+      .filter(fk == entity_id) \
+      .subquery()
+    past_count = select(func.count(Show.id)) \
+      .where(fk == entity_id, is_past) \
+      .scalar_subquery()
+
+    joined = shows.c.owner_id == entity.id
+    if past_limit is not None:
+        joined = and_(joined, or_(shows.c.start_time >= now, shows.c.past_rank <= past_limit))
+    rows = db.session.query(
+        *columns,
+        shows.c.other_id,
+        shows.c.other_name,
+        shows.c.other_image_link,
+        shows.c.start_time,
+        past_count.label('past_count')
+      ).outerjoin(shows, joined) \
+      .filter(entity.id == entity_id) \
+      .order_by(shows.c.start_time) \
+      .all()
+    if not rows:
+        return None
+
+    data = {column.key: rows[0][index] for index, column in enumerate(columns)}
+    past_shows, upcoming_shows = [], []
+    for row in rows:
+        if row.start_time is None:
+            continue
+        show = record(row.other_id, row.other_name, row.other_image_link, row.start_time)
+        (past_shows if row.start_time < now else upcoming_shows).append(show)
+    past_shows.reverse()
+
+    data.update({
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": rows[0].past_count or 0,
+        "upcoming_shows_count": len(upcoming_shows)
+    })
+    return data
+
+
+def venue_page(venue_id, now, past_limit=None):
+    # Venue detail plus its shows split into past (newest first, at most
+    # past_limit of them) and upcoming, from a single query. None if the
+    # venue does not exist.
+    return _page_with_shows(Venue, VENUE_DETAIL_COLUMNS, Show.venue_id, Artist, Show.artist_id,
+                            VenueShow, venue_id, now, past_limit)
+
+
+def artist_page(artist_id, now, past_limit=None):
+    # Artist counterpart of venue_page.
+    return _page_with_shows(Artist, ARTIST_DETAIL_COLUMNS, Show.artist_id, Venue, Show.venue_id,
+                            ArtistShow, artist_id, now, past_limit)
+
+
+#----------------------------------------------------------------------------#
+# Watermarks.
+#----------------------------------------------------------------------------#
+
+# Cheap stand-ins for "has this page changed", used for ETag and
+# Last-Modified before any of the page's data is loaded.
+
+def table_watermark(*tables):
+    # Latest write to any of the tables, deletes included.
+    return db.session.query(func.max(Watermark.updated_at)) \
+      .filter(Watermark.table.in_(tables)) \
+      .scalar()
+
+
+def _page_watermark(entity, fk, other, other_fk, entity_id, now):
+    # The entity's own updated_at, the latest updated_at of its shows and
+    # of the venues/artists on them (counters keep these current when shows
+    # are added or removed), and the start of the latest show that has
+    # already begun, which moves a show from upcoming to past.
+    return db.session.query(
+        func.max(entity.updated_at),
+        func.max(Show.updated_at),
+        func.max(other.updated_at),
+        func.max(Show.start_time).filter(Show.start_time < now)
+      ).select_from(entity) \
+      .outerjoin(Show, fk == entity.id) \
+      .outerjoin(other, other.id == other_fk) \
+      .filter(entity.id == entity_id) \
+      .group_by(entity.id) \
+      .first()
+
+
+def venue_watermark(venue_id, now):
+    return _page_watermark(Venue, Show.venue_id, Artist, Show.artist_id, venue_id, now)
+
+
+def artist_watermark(artist_id, now):
+    return _page_watermark(Artist, Show.artist_id, Venue, Show.venue_id, artist_id, now)
@@ -0,0 +1,88 @@
+import random
+import time
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+# With SQLALCHEMY_REPLICA_URIS set, GET and HEAD requests read from one of
+# the replicas (picked per request, so a page sees one consistent copy)
+# and every other request, the CLI and background threads use the primary
+# at SQLALCHEMY_DATABASE_URI. Replicas are registered as Flask-SQLAlchemy
+# binds named replica0, replica1, ... that no model is mapped to, so
+# create_all and migrations never touch them.
+#
+# A replica may lag behind the primary. So that someone who just edited a
+# venue sees their edit on the page they are redirected to, any request
+# other than GET/HEAD/OPTIONS sets a cookie that pins the client to the
+# primary for REPLICA_PIN_SECONDS. Pinned requests also rebuild the cached
+# page data instead of trusting it (see app.py), since another client may
+# have cached what a lagging replica returned.
+#
+# Without replicas configured nothing changes: no binds, no cookie.
+
+PIN_COOKIE = 'fyyur_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_request_context():
+            bind = g.get('replica_bind')
+            if bind is not None:
+                return self.db.get_engine(self.app, bind)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter:
+    def __init__(self, app=None):
+        self.binds = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('REPLICA_PIN_SECONDS', 10)
+        self.app = app
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for index, uri in enumerate(app.config['SQLALCHEMY_REPLICA_URIS']):
+            name = 'replica{}'.format(index)
+            binds[name] = uri
+            self.binds.append(name)
+        if self.binds:
+            app.config['SQLALCHEMY_BINDS'] = binds
+            app.before_request(self._route)
+            app.after_request(self._pin)
+        app.extensions['replicas'] = self
+
+    def pinned(self):
+        # True while the client's pin cookie is valid.
+        if not self.binds or not has_request_context():
+            return False
+        try:
+            return float(request.cookies.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _route(self):
+        if request.method in SAFE_METHODS and not self.pinned():
+            g.replica_bind = random.choice(self.binds)
+
+    def _pin(self, response):
+        if request.method not in SAFE_METHODS:
+            seconds = self.app.config['REPLICA_PIN_SECONDS']
+            response.set_cookie(PIN_COOKIE, '{:.3f}'.format(time.time() + seconds),
+                                max_age=seconds, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,90 @@
+from sqlalchemy import func, text
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Name search.
+#----------------------------------------------------------------------------#
+
+# Case-insensitive substring search over Venue.name and Artist.name.
+#
+# On PostgreSQL with pg_trgm the ILIKE '%term%' filter is served by the
+# trigram GIN indexes on the name columns (see models.py) and results are
+# ranked by trigram similarity. Without the extension, e.g. on a schema
+# made by hand where it could not be installed, the same filter runs
+# unranked, ordered by name.
+#
+# Both return (total, rows) where rows carry id, name and
+# num_upcoming_shows, and total is the number of matches before limit and
+# offset are applied. Everything comes back from a single query.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# Whether pg_trgm is installed, per database URL; checked once per process.
+_trigram = {}
+
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%' + escaped + '%'
+
+
+def _has_trigram():
+    url = str(db.engine.url)
+    if url not in _trigram:
+        _trigram[url] = db.session.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+    return _trigram[url]
+
+
+def _search_trigram(model, term, limit, offset):
+    similarity = func.similarity(model.name, term)
+    rows = db.session.query(
+        model.id,
+        model.name,
+        model.num_upcoming_shows,
+        func.count().over().label('total')
+      ).filter(model.name.ilike(_like_pattern(term), escape='\\')) \
+      .order_by(similarity.desc(), model.name, model.id) \
+      .limit(limit) \
+      .offset(offset) \
+      .all()
+    return rows
+
+
+def _search_like(model, term, limit, offset):
+    return db.session.query(
+        model.id,
+        model.name,
+        model.num_upcoming_shows,
+        func.count().over().label('total')
+      ).filter(model.name.ilike(_like_pattern(term), escape='\\')) \
+      .order_by(model.name, model.id) \
+      .limit(limit) \
+      .offset(offset) \
+      .all()
+
+
+def search(model, term, limit=DEFAULT_LIMIT, offset=0):
+    term = (term or '').strip()
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    offset = max(0, int(offset))
+
+    if db.engine.dialect.name == 'postgresql' and _has_trigram():
+        rows = _search_trigram(model, term, limit, offset)
+    else:
+        rows = _search_like(model, term, limit, offset)
+
+    total = rows[0].total if rows else 0
+    if not rows and offset:
+        # Past the last page the window count is not available.
+        total = search(model, term, limit, 0)[0]
+    return total, rows
+
+
+def search_venues(term, limit=DEFAULT_LIMIT, offset=0):
+    return search(Venue, term, limit, offset)
+
+
+def search_artists(term, limit=DEFAULT_LIMIT, offset=0):
+    return search(Artist, term, limit, offset)
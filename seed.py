@@ -0,0 +1,179 @@
+import datetime
+import random
+from itertools import islice
+import click
+from flask.cli import with_appcontext
+from forms import VenueForm, ArtistForm
+from models import db, Venue, Artist, Show, SHOW_DURATION, touch
+import counters
+import directory
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#----------------------------------------------------------------------------#
+
+# `flask seed` fills the database with realistic volumes of venues, artists
+# and shows for benchmarking, e.g.
+#
+#   flask seed --venues 50000 --artists 200000 --shows 5000000
+#
+# Genres and states come from the choices in forms.py. Rows are inserted
+# with executemany in batches and the same --seed always produces the same
+# data. Shows are never double-booked (see bookings.py); the only thing
+# kept in memory is, per venue and artist, the time it is next free.
+
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+STATES = [value for value, _ in ArtistForm.state.kwargs['choices']]
+
+CITY_PARTS = ['Spring', 'River', 'Oak', 'Lake', 'Cedar', 'Pine', 'Maple', 'Fair', 'Green', 'Mill']
+CITY_SUFFIXES = ['field', 'ton', 'ville', ' City', 'port', 'wood', ' Falls', ' Heights']
+VENUE_WORDS = ['Hall', 'Lounge', 'Room', 'Club', 'Theatre', 'Bar', 'Garden', 'Stage', 'Tavern', 'Loft']
+ADJECTIVES = ['Musical', 'Blue', 'Golden', 'Velvet', 'Electric', 'Midnight', 'Wild', 'Dueling', 'Silver', 'Rusty']
+NOUNS = ['Hop', 'Piano', 'Petals', 'Sax', 'Owls', 'Echo', 'Lantern', 'Comet', 'Harbor', 'Tide']
+ACTS = ['Band', 'Trio', 'Quartet', 'Collective', 'Orchestra', 'Project', 'Ensemble', 'Crew']
+FIRST_NAMES = ['Matt', 'Ana', 'Leo', 'Maya', 'Sam', 'Iris', 'Omar', 'Jules', 'Nia', 'Theo']
+LAST_NAMES = ['Quevado', 'Reyes', 'Okafor', 'Lindqvist', 'Tanaka', 'Moreau', 'Novak', 'Haddad']
+
+
+def _areas(rng, count):
+    # A fixed pool of (city, state) pairs so areas hold many venues each.
+    return [(rng.choice(CITY_PARTS) + rng.choice(CITY_SUFFIXES), rng.choice(STATES))
+            for _ in range(count)]
+
+
+def _genres(rng):
+    return rng.sample(GENRES, rng.randint(1, 3))
+
+
+def _venue(rng, areas):
+    city, state = rng.choice(areas)
+    name = 'The {} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(NOUNS), rng.choice(VENUE_WORDS))
+    seeking = rng.random() < 0.3
+    return {
+        'name': name,
+        'city': city,
+        'state': state,
+        'address': '{} {} St'.format(rng.randint(1, 9999), rng.choice(NOUNS)),
+        'phone': '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(0, 999), rng.randint(0, 9999)),
+        'image_link': 'https://images.example.com/venues/{}.jpg'.format(rng.randint(1, 500)),
+        'facebook_link': 'https://www.facebook.com/{}'.format(name.replace(' ', '')),
+        'genres': _genres(rng),
+        'website': 'https://www.{}.com'.format(name.replace(' ', '').lower()),
+        'seeking_talent': seeking,
+        'seeking_description': 'Looking for local acts.' if seeking else None,
+        'num_upcoming_shows': 0,
+        'venue_past_shows': 0,
+    }
+
+
+def _artist(rng, areas):
+    city, state = rng.choice(areas)
+    if rng.random() < 0.5:
+        name = '{} {}'.format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+    else:
+        name = 'The {} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(NOUNS), rng.choice(ACTS))
+    seeking = rng.random() < 0.4
+    return {
+        'name': name,
+        'city': city,
+        'state': state,
+        'phone': '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(0, 999), rng.randint(0, 9999)),
+        'genres': _genres(rng),
+        'image_link': 'https://images.example.com/artists/{}.jpg'.format(rng.randint(1, 500)),
+        'facebook_link': 'https://www.facebook.com/{}'.format(name.replace(' ', '')),
+        'website': None,
+        'seeking_venue': seeking,
+        'seeking_description': 'Looking for shows.' if seeking else None,
+        'artist_past_shows': 0,
+        'num_upcoming_shows': 0,
+    }
+
+
+def _insert(model, make, count, batch_size):
+    # Insert count rows built by make() and return their ids.
+    for start in range(0, count, batch_size):
+        rows = [make() for _ in range(min(batch_size, count - start))]
+        db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+        click.echo('  {}: {}/{}'.format(model.__tablename__, start + len(rows), count))
+    return [row[0] for row in db.session.query(model.id).order_by(model.id)]
+
+
+def seed(venues, artists, shows, batch_size=10000, past_fraction=0.6, years=2, areas=400, seed_value=42):
+    rng = random.Random(seed_value)
+    pool = _areas(rng, areas)
+
+    venue_ids = _insert(Venue, lambda: _venue(rng, pool), venues, batch_size)
+    artist_ids = _insert(Artist, lambda: _artist(rng, pool), artists, batch_size)
+
+    # Shows last SHOW_DURATION and start every two hours from 8am to 10pm,
+    # spread evenly over `years` years either side of now with
+    # past_fraction of them in the past.
+    now = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+    span = years * 365
+    hours = range(8, 23, SHOW_DURATION.seconds // 3600)
+    past = round(shows * past_fraction)
+    sides = ((range(-span, 0), past), (range(1, span + 1), shows - past))
+    per_slot = max(-(-count // (len(days) * len(hours))) for days, count in sides)
+    if per_slot > min(len(venue_ids), len(artist_ids)):
+        raise click.UsageError('{} shows at once need more venues and artists'.format(per_slot))
+
+    def starts():
+        # Start times in ascending order; each slot gets an equal share and
+        # the remainder goes to randomly chosen slots.
+        for days, count in sides:
+            slots = [now.replace(hour=hour) + datetime.timedelta(days=day) for day in days for hour in hours]
+            extra = set(rng.sample(range(len(slots)), count % len(slots)))
+            for i, start in enumerate(slots):
+                for _ in range(count // len(slots) + (i in extra)):
+                    yield start
+
+    # Shows are made in start order, so each venue and artist only needs a
+    # cursor: the time its last show ends. One whose cursor is past the
+    # start is busy and another is drawn.
+    venue_free, artist_free = {}, {}
+
+    def pick(ids, free, start):
+        while True:
+            entity_id = rng.choice(ids)
+            if free.get(entity_id, start) <= start:
+                free[entity_id] = start + SHOW_DURATION
+                return entity_id
+
+    def make_show(start):
+        return {
+            'venue_id': pick(venue_ids, venue_free, start),
+            'artist_id': pick(artist_ids, artist_free, start),
+            'start_time': start,
+            'end_time': start + SHOW_DURATION,
+            'upcoming_show': start > now,
+        }
+
+    show_starts = starts()
+    for start in range(0, shows, batch_size):
+        rows = [make_show(show_start) for show_start in islice(show_starts, batch_size)]
+        db.session.execute(Show.__table__.insert(), rows)
+        db.session.commit()
+        click.echo('  Show: {}/{}'.format(start + len(rows), shows))
+
+    click.echo('Recounting show counters')
+    counters.recount()
+    directory.rebuild()
+    touch(db.session, 'Venue', 'Artist', 'Show')
+    db.session.commit()
+
+
+@click.command('seed')
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=4000, show_default=True)
+@click.option('--shows', default=100000, show_default=True)
+@click.option('--batch-size', default=10000, show_default=True)
+@click.option('--past-fraction', default=0.6, show_default=True, help='Share of shows in the past.')
+@click.option('--years', default=2, show_default=True, help='Shows span this many years each side of now.')
+@click.option('--areas', default=400, show_default=True, help='Distinct (city, state) pairs.')
+@click.option('--seed', 'seed_value', default=42, show_default=True, help='Random seed.')
+@with_appcontext
+def seed_command(venues, artists, shows, batch_size, past_fraction, years, areas, seed_value):
+    """Fill the database with synthetic venues, artists and shows."""
+    seed(venues, artists, shows, batch_size, past_fraction, years, areas, seed_value)
+    click.echo('Seeded {} venues, {} artists and {} shows'.format(venues, artists, shows))
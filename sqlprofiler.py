@@ -0,0 +1,152 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# SQL profiler.
+#----------------------------------------------------------------------------#
+
+# Records every statement sent to the database while a request (or an
+# assert_max_queries block) is active: how many, how long in total, and how
+# often each statement shape repeats. A shape is the statement with its
+# parameters and literals replaced by '?', so the per-row queries of an N+1
+# loop all share one shape and stand out.
+#
+#   profiler = QueryProfiler(app)
+#
+#   with profiler.assert_max_queries(2):
+#       client.get('/venues')
+#
+# Settings:
+#   SQL_SLOW_QUERY_MS     statements slower than this are logged (200)
+#   SQL_NPLUS1_THRESHOLD  a shape repeated this often in one request is
+#                         logged as a likely N+1 (5)
+#   SQL_PROFILE_HEADERS   add X-Query-Count / X-Query-Time-Ms to responses
+#                         (defaults to app.debug)
+
+logger = logging.getLogger('fyyur.sql')
+
+_WHITESPACE = re.compile(r'\s+')
+_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s|\?|:\w+|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+
+
+def normalize(statement):
+    shape = _PLACEHOLDERS.sub('?', statement)
+    shape = _LISTS.sub('(?...)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class Recorder:
+    # statements holds (statement, parameters, duration) as sent to the
+    # DBAPI cursor, so they can be replayed, e.g. under EXPLAIN.
+    def __init__(self):
+        self.statements = []
+        self.total_time = 0.0
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def record(self, statement, parameters, duration):
+        self.statements.append((statement, parameters, duration))
+        self.total_time += duration
+
+    def shapes(self):
+        return Counter(normalize(statement) for statement, _, _ in self.statements)
+
+    def repeated(self, threshold):
+        return [(shape, count) for shape, count in self.shapes().most_common() if count >= threshold]
+
+
+class QueryProfiler:
+    def __init__(self, app=None):
+        self.app = None
+        self._local = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('SQL_SLOW_QUERY_MS', 200)
+        app.config.setdefault('SQL_NPLUS1_THRESHOLD', 5)
+        app.config.setdefault('SQL_PROFILE_HEADERS', app.debug)
+        app.extensions['sqlprofiler'] = self
+
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+
+    @property
+    def _active(self):
+        if not hasattr(self._local, 'recorders'):
+            self._local.recorders = []
+        return self._local.recorders
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._active:
+            conn.info.setdefault('profiler_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('profiler_start')
+        if not self._active or not starts:
+            return
+        duration = time.perf_counter() - starts.pop()
+        for recorder in self._active:
+            recorder.record(statement, parameters, duration)
+        if duration * 1000 >= self.app.config['SQL_SLOW_QUERY_MS']:
+            logger.warning('Slow query (%.1f ms) in %s: %s', duration * 1000,
+                           request.path if has_request_context() else '-', normalize(statement))
+
+    @contextmanager
+    def record(self):
+        recorder = Recorder()
+        self._active.append(recorder)
+        try:
+            yield recorder
+        finally:
+            self._active.remove(recorder)
+
+    @contextmanager
+    def assert_max_queries(self, limit):
+        # For tests: fail if the block issues more than `limit` statements.
+        with self.record() as recorder:
+            yield recorder
+        if recorder.count > limit:
+            listing = '\n'.join('  {}x {}'.format(count, shape)
+                                for shape, count in recorder.shapes().most_common())
+            raise AssertionError('{} queries executed, at most {} expected:\n{}'.format(
+                recorder.count, limit, listing))
+
+    def _start_request(self):
+        g.sql_recorder = Recorder()
+        self._active.append(g.sql_recorder)
+
+    def _finish_request(self, response):
+        recorder = g.pop('sql_recorder', None)
+        if recorder is None:
+            return response
+        if recorder in self._active:
+            self._active.remove(recorder)
+
+        for shape, count in recorder.repeated(self.app.config['SQL_NPLUS1_THRESHOLD']):
+            logger.warning('Possible N+1 in %s %s: %d x %s', request.method, request.path, count, shape)
+
+        if self.app.config['SQL_PROFILE_HEADERS']:
+            response.headers['X-Query-Count'] = str(recorder.count)
+            response.headers['X-Query-Time-Ms'] = '{:.2f}'.format(recorder.total_time * 1000)
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request is skipped when the view raises; drop the recorder here.
+        recorder = g.pop('sql_recorder', None)
+        if recorder in self._active:
+            self._active.remove(recorder)
@@ -0,0 +1,66 @@
+"""Fixtures for the tests, which run against a real database.
+
+The models use PostgreSQL arrays, range exclusion constraints and GIN
+indexes, so the tests need a scratch PostgreSQL database (its tables are
+dropped and recreated) and are skipped without one:
+
+    TEST_DATABASE_URL=postgresql://localhost/fyyur_test python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+@pytest.fixture(scope='session')
+def fyyur():
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set to a scratch PostgreSQL database')
+    # config.py reads DATABASE_URL when app.py is imported.
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+    import app as fyyur
+    from cache import NullBackend
+
+    fyyur.app.config['TESTING'] = True
+    # Cached pages send no queries; every request has to build its page.
+    fyyur.cache.backend = NullBackend()
+    with fyyur.app.app_context():
+        fyyur.db.drop_all()
+        fyyur.db.create_all()
+    yield fyyur
+    with fyyur.app.app_context():
+        fyyur.db.session.remove()
+        fyyur.db.drop_all()
+
+
+def _empty(db):
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(table.delete())
+    db.session.commit()
+
+
+@pytest.fixture
+def db(fyyur):
+    # An empty database and an app context for the test.
+    with fyyur.app.app_context():
+        _empty(fyyur.db)
+        yield fyyur.db
+        fyyur.db.session.remove()
+
+
+@pytest.fixture
+def reseed(fyyur):
+    # reseed(scale) replaces every row with 50 * scale venues, 100 * scale
+    # artists and 500 * scale shows from seed.py.
+    import seed
+
+    def reseed(scale):
+        with fyyur.app.app_context():
+            _empty(fyyur.db)
+            seed.seed(venues=50 * scale, artists=100 * scale, shows=500 * scale, batch_size=1000, areas=20)
+            fyyur.db.session.remove()
+    return reseed
@@ -0,0 +1,32 @@
+"""Venue availability search, /api/v1/venues/available. Needs
+TEST_DATABASE_URL, see conftest.py.
+"""
+import datetime
+
+from models import Artist, Show, Venue
+
+START = datetime.datetime(2030, 6, 1, 20, 0)
+
+
+def test_available_venues_skip_booked_and_filter_by_genre(fyyur, db):
+    def venue(name, genres):
+        return Venue(name=name, city='Austin', state='TX', address='1 Main St', phone='555-0100', genres=genres)
+
+    booked, jazz, rock = venue('Booked Hall', ['Jazz']), venue('Jazz Room', ['Jazz', 'Blues']), venue('Rock Club', ['Rock n Roll'])
+    artist = Artist(name='The Quartet', city='Austin', state='TX', phone='555-0101', genres=['Jazz'])
+    db.session.add_all([booked, jazz, rock, artist])
+    db.session.flush()
+    db.session.add(Show(venue_id=booked.id, artist_id=artist.id, start_time=START - datetime.timedelta(hours=1),
+                        end_time=START + datetime.timedelta(hours=1)))
+    db.session.commit()
+    client = fyyur.app.test_client()
+
+    def names(**args):
+        args = dict(start=START.isoformat(), end=(START + datetime.timedelta(hours=3)).isoformat(), **args)
+        response = client.get('/api/v1/venues/available', query_string=args)
+        assert response.status_code == 200, response.data
+        return sorted(venue['name'] for venue in response.get_json()['data'])
+
+    assert names(city='Austin', state='TX') == ['Jazz Room', 'Rock Club']
+    assert names(city='Austin', state='TX', genres='Jazz') == ['Jazz Room']
+    assert names(genres='Jazz,Blues') == ['Jazz Room']
@@ -0,0 +1,58 @@
+"""Double-booking rules (see bookings.py): back-to-back shows are fine,
+overlapping ones at the same venue or with the same artist are refused by
+the exclusion constraints, and conflicts() reports them first. Needs
+TEST_DATABASE_URL, see conftest.py.
+"""
+import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import bookings
+from models import Artist, Show, Venue
+
+EIGHT_PM = datetime.datetime(2030, 6, 1, 20, 0)
+HOUR = datetime.timedelta(hours=1)
+
+
+@pytest.fixture
+def booked(db):
+    # Two venues and two artists, and venue 0 / artist 0 booked 8pm-10pm.
+    venues = [Venue(name='Venue {}'.format(i), city='Austin', state='TX', address='1 Main St',
+                    phone='555-0100', genres=['Jazz']) for i in range(2)]
+    artists = [Artist(name='Artist {}'.format(i), city='Austin', state='TX', phone='555-0101',
+                      genres=['Jazz']) for i in range(2)]
+    db.session.add_all(venues + artists)
+    db.session.flush()
+    db.session.add(Show(venue_id=venues[0].id, artist_id=artists[0].id,
+                        start_time=EIGHT_PM, end_time=EIGHT_PM + 2 * HOUR))
+    db.session.commit()
+    return [venue.id for venue in venues], [artist.id for artist in artists]
+
+
+def add_show(db, venue_id, artist_id, start, end):
+    db.session.add(Show(venue_id=venue_id, artist_id=artist_id, start_time=start, end_time=end))
+    db.session.commit()
+
+
+def test_back_to_back_shows_are_allowed(db, booked):
+    (venue, other_venue), (artist, other_artist) = booked
+    assert bookings.conflicts(venue, other_artist, EIGHT_PM + 2 * HOUR, EIGHT_PM + 3 * HOUR) == []
+    add_show(db, venue, other_artist, EIGHT_PM + 2 * HOUR, EIGHT_PM + 3 * HOUR)
+    add_show(db, other_venue, artist, EIGHT_PM - HOUR, EIGHT_PM)
+    assert db.session.query(Show).count() == 3
+
+
+@pytest.mark.parametrize('same', ['venue', 'artist'])
+def test_overlapping_shows_are_rejected(db, booked, same):
+    (venue, other_venue), (artist, other_artist) = booked
+    venue_id = venue if same == 'venue' else other_venue
+    artist_id = artist if same == 'artist' else other_artist
+    start, end = EIGHT_PM + HOUR, EIGHT_PM + 3 * HOUR
+
+    assert len(bookings.conflicts(venue_id, artist_id, start, end)) == 1
+    # Past the application check, the database refuses it.
+    with pytest.raises(IntegrityError, match='ex_Show_{}_booking'.format(same)):
+        add_show(db, venue_id, artist_id, start, end)
+    db.session.rollback()
+    assert db.session.query(Show).count() == 1
@@ -0,0 +1,72 @@
+"""Show counters (see counters.py), in particular that overlapping
+rollover runs count every show once. Needs TEST_DATABASE_URL, see
+conftest.py.
+"""
+import datetime
+import threading
+import time
+
+import counters
+from models import Artist, Show, Venue
+
+NOW = datetime.datetime(2030, 6, 1, 12, 0)
+
+
+def add_shows(db, starts):
+    venue = Venue(name='The Blue Room', city='Austin', state='TX', address='1 Main St',
+                  phone='555-0100', genres=['Jazz'])
+    artist = Artist(name='The Quartet', city='Austin', state='TX', phone='555-0101', genres=['Jazz'])
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    for start in starts:
+        show = Show(venue_id=venue.id, artist_id=artist.id, start_time=start)
+        db.session.add(show)
+        counters.record_show(show, now=NOW - datetime.timedelta(days=30))
+    db.session.commit()
+    return venue.id, artist.id
+
+
+def counts(db, venue_id, artist_id):
+    db.session.expire_all()
+    venue, artist = db.session.get(Venue, venue_id), db.session.get(Artist, artist_id)
+    return (venue.num_upcoming_shows, venue.venue_past_shows), (artist.num_upcoming_shows, artist.artist_past_shows)
+
+
+def test_rollover_moves_started_shows(db):
+    starts = [NOW - datetime.timedelta(days=2), NOW - datetime.timedelta(days=1), NOW + datetime.timedelta(days=1)]
+    venue_id, artist_id = add_shows(db, starts)
+    assert counts(db, venue_id, artist_id) == ((3, 0), (3, 0))
+
+    assert counters.rollover(NOW) == 2
+    db.session.commit()
+    assert counts(db, venue_id, artist_id) == ((1, 2), (1, 2))
+    assert counters.rollover(NOW) == 0
+
+
+def test_overlapping_rollovers_count_each_show_once(fyyur, db):
+    starts = [NOW - datetime.timedelta(days=days) for days in (1, 2, 3)]
+    venue_id, artist_id = add_shows(db, starts)
+    first_done, release = threading.Event(), threading.Event()
+    rolled = {}
+
+    def run(name, hold):
+        with fyyur.app.app_context():
+            rolled[name] = counters.rollover(NOW)
+            if hold:
+                first_done.set()
+                release.wait(10)
+            fyyur.db.session.commit()
+
+    first = threading.Thread(target=run, args=('first', True))
+    first.start()
+    assert first_done.wait(10)
+    # The second run starts while the first has not committed yet.
+    second = threading.Thread(target=run, args=('second', False))
+    second.start()
+    time.sleep(0.5)
+    release.set()
+    first.join(10)
+    second.join(10)
+
+    assert rolled == {'first': 3, 'second': 0}
+    assert counts(db, venue_id, artist_id) == ((0, 3), (0, 3))
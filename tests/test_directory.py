@@ -0,0 +1,14 @@
+"""The /venues directory (see directory.py). Needs TEST_DATABASE_URL, see
+conftest.py.
+"""
+import queries
+
+
+def test_refresh_moves_the_venues_watermark(fyyur, reseed):
+    reseed(1)
+    with fyyur.app.app_context():
+        before = queries.table_watermark('Venue', 'Show')
+    result = fyyur.app.test_cli_runner().invoke(args=['refresh-venue-directory'])
+    assert result.exit_code == 0, result.output
+    with fyyur.app.app_context():
+        assert queries.table_watermark('Venue', 'Show') > before
@@ -0,0 +1,26 @@
+"""Editing a venue stores its seeking_talent flag. Needs TEST_DATABASE_URL,
+see conftest.py.
+"""
+from models import Venue
+
+FORM = {
+    'name': 'The Blue Room', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+    'phone': '555-0100', 'facebook_link': '', 'genres': ['Jazz'], 'image_link': '',
+    'website_link': '', 'seeking_description': 'Looking for a trio',
+}
+
+
+def test_edit_venue_sets_seeking_talent(fyyur, db):
+    venue = Venue(name='The Blue Room', city='Austin', state='TX', address='1 Main St',
+                  phone='555-0100', genres=['Jazz'], seeking_talent=False)
+    db.session.add(venue)
+    db.session.commit()
+    venue_id = venue.id
+    client = fyyur.app.test_client()
+
+    client.post('/venues/{}/edit'.format(venue_id), data=dict(FORM, seeking_talent='y'))
+    assert db.session.get(Venue, venue_id).seeking_talent is True
+
+    db.session.expire_all()
+    client.post('/venues/{}/edit'.format(venue_id), data=FORM)
+    assert not db.session.get(Venue, venue_id).seeking_talent
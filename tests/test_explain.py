@@ -0,0 +1,16 @@
+"""flask explain-check as a test: the hot pages' statements must not scan
+a large table in full (see explain.py). Needs TEST_DATABASE_URL, see
+conftest.py.
+"""
+import explain
+
+
+def test_hot_pages_use_indexes(fyyur, reseed):
+    reseed(20)
+    with fyyur.app.app_context():
+        # Fresh statistics, so the planner sees the seeded table sizes.
+        fyyur.db.session.execute(fyyur.db.text('ANALYZE'))
+        fyyur.db.session.commit()
+
+    violations = explain.check(fyyur.app, fyyur.cache, min_rows=1000)
+    assert [(url, table) for url, table, _, _ in violations] == []
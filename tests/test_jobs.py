@@ -0,0 +1,64 @@
+"""The background job queue (see jobs.py): dedupe by key, and retries
+with backoff until a job is marked failed. Needs TEST_DATABASE_URL, see
+conftest.py.
+"""
+import pytest
+
+from models import Job
+
+
+@pytest.fixture
+def jobs(fyyur, db, monkeypatch):
+    monkeypatch.setitem(fyyur.app.config, 'JOBS_ENABLED', True)
+    monkeypatch.setitem(fyyur.app.config, 'JOBS_RETRY_DELAY', 0)
+    monkeypatch.setitem(fyyur.app.config, 'JOBS_MAX_ATTEMPTS', 3)
+    return fyyur.jobs
+
+
+def test_key_dedupes_waiting_jobs(jobs, db, monkeypatch):
+    calls = []
+    monkeypatch.setitem(jobs.tasks, 'record', calls.append)
+    for _ in range(3):
+        jobs.defer('record', 'venue:1', key='venue:1')
+        db.session.commit()
+    jobs.defer('record', 'venue:2', key='venue:2')
+    db.session.commit()
+    assert db.session.query(Job).count() == 2
+
+    jobs.work(threads=1, burst=True)
+    assert sorted(calls) == ['venue:1', 'venue:2']
+    assert db.session.query(Job).count() == 0
+
+
+def test_key_queues_again_once_started(jobs, db, monkeypatch):
+    monkeypatch.setitem(jobs.tasks, 'record', lambda value: None)
+    jobs.defer('record', 1, key='one')
+    db.session.commit()
+    # A worker has claimed the job but not finished it.
+    assert jobs._claim() is not None
+    jobs.defer('record', 1, key='one')
+    db.session.commit()
+    assert db.session.query(Job).count() == 2
+
+
+def test_failing_job_is_retried_then_marked_failed(jobs, db, monkeypatch):
+    attempts = []
+
+    def broken(value):
+        attempts.append(value)
+        raise RuntimeError('boom')
+
+    monkeypatch.setitem(jobs.tasks, 'broken', broken)
+    jobs.defer('broken', 7)
+    db.session.commit()
+
+    jobs.work(threads=1, burst=True)
+    assert attempts == [7, 7, 7]
+    job = db.session.query(Job).one()
+    assert job.attempts == 3
+    assert job.failed_at is not None
+    assert job.last_error == 'RuntimeError: boom'
+
+    # Failed jobs are kept but never picked up again.
+    jobs.work(threads=1, burst=True)
+    assert len(attempts) == 3
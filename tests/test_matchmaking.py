@@ -0,0 +1,81 @@
+"""Venue and artist matchmaking (see matchmaking.py): candidates ranked by
+shared genres, city, state, recent shows and whether they are seeking,
+with and without NumPy. Needs TEST_DATABASE_URL, see conftest.py.
+"""
+import datetime
+
+import pytest
+
+import matchmaking
+from matchmaking import MatchIndex
+from models import Artist, Show, Venue
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def artists(request, db, monkeypatch):
+    if request.param == 'numpy' and matchmaking.numpy is None:
+        pytest.skip('NumPy is not installed')
+    if request.param == 'python':
+        monkeypatch.setattr(matchmaking, 'numpy', None)
+
+    venue = Venue(name='The Blue Room', city='Austin', state='TX', address='1 Main St',
+                  phone='555-0100', genres=['Jazz', 'Blues'])
+    rows = {
+        'both genres, same city, seeking': ('Austin', 'TX', ['Jazz', 'Blues'], True),
+        'both genres, same state, seeking': ('Dallas', 'TX', ['Jazz', 'Blues'], True),
+        'one genre, same city, busy': ('Austin', 'TX', ['Jazz'], False),
+        'other genre, elsewhere, seeking': ('Seattle', 'WA', ['Rock n Roll'], True),
+    }
+    by_name = {}
+    for name, (city, state, genres, seeking) in rows.items():
+        by_name[name] = Artist(name=name, city=city, state=state, phone='555-0101',
+                               genres=genres, seeking_venue=seeking)
+    db.session.add(venue)
+    db.session.add_all(by_name.values())
+    db.session.flush()
+    # Recent shows for the busy artist only: the most active candidate.
+    busy = by_name['one genre, same city, busy']
+    for days in (10, 20, 30):
+        start = datetime.datetime.now() - datetime.timedelta(days=days)
+        db.session.add(Show(venue_id=venue.id, artist_id=busy.id, start_time=start))
+    db.session.commit()
+
+    index = MatchIndex('artist')
+    index.build()
+    names = {artist.id: name for name, artist in by_name.items()}
+    return index, names
+
+
+def test_candidates_are_ranked_by_score(artists):
+    index, names = artists
+    ranked = [(names[artist_id], score) for artist_id, score in index.top(['Jazz', 'Blues'], 'Austin', 'TX')]
+    assert ranked == [
+        # genre 4 + city 2 + state 1 + available 2
+        ('both genres, same city, seeking', 9.0),
+        # genre 4 + state 1 + available 2
+        ('both genres, same state, seeking', 7.0),
+        # genre 2 + city 2 + state 1 + activity 1
+        ('one genre, same city, busy', 6.0),
+        # available 2
+        ('other genre, elsewhere, seeking', 2.0),
+    ]
+
+
+def test_limit_and_seeking_only(artists):
+    index, names = artists
+    top = index.top(['Jazz', 'Blues'], 'Austin', 'TX', limit=2, seeking_only=True)
+    assert [names[artist_id] for artist_id, _ in top] == [
+        'both genres, same city, seeking',
+        'both genres, same state, seeking',
+    ]
+    seeking = index.top(['Jazz', 'Blues'], 'Austin', 'TX', seeking_only=True)
+    assert 'one genre, same city, busy' not in [names[artist_id] for artist_id, _ in seeking]
+
+
+def test_updates_between_builds(artists):
+    index, names = artists
+    ids = {name: artist_id for artist_id, name in names.items()}
+    index.discard(ids['both genres, same city, seeking'])
+    index.put(ids['other genre, elsewhere, seeking'], ['Jazz', 'Blues'], 'Austin', 'TX', True)
+    top = index.top(['Jazz', 'Blues'], 'Austin', 'TX', limit=1)
+    assert [(names[artist_id], score) for artist_id, score in top] == [('other genre, elsewhere, seeking', 9.0)]
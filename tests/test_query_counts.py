@@ -0,0 +1,44 @@
+"""Query counts of the listing and detail pages.
+
+Seeds the database at two sizes, ten times apart, and checks that /venues,
+/artists, /shows and the venue and artist pages send no more statements at
+the larger size than at the smaller one. Needs TEST_DATABASE_URL, see
+conftest.py.
+"""
+PAGES = ['/venues', '/artists', '/shows', '/venues/{venue_id}', '/artists/{artist_id}']
+
+
+def busiest(fyyur, fk):
+    db = fyyur.db
+    with fyyur.app.app_context():
+        return db.session.query(fk).group_by(fk).order_by(db.func.count().desc()).limit(1).scalar()
+
+
+def page_urls(fyyur):
+    from models import Show
+    ids = {'venue_id': busiest(fyyur, Show.venue_id), 'artist_id': busiest(fyyur, Show.artist_id)}
+    return {page: page.format(**ids) for page in PAGES}
+
+
+def query_counts(fyyur, client):
+    counts = {}
+    for page, url in page_urls(fyyur).items():
+        with fyyur.profiler.record() as recorder:
+            response = client.get(url)
+        assert response.status_code == 200, url
+        counts[page] = recorder.count
+    return counts
+
+
+def test_page_query_counts_do_not_grow_with_rows(fyyur, reseed):
+    client = fyyur.app.test_client()
+    reseed(1)
+    # The first request loads the in-memory indexes; keep it out of the counts.
+    client.get('/')
+    small = query_counts(fyyur, client)
+
+    reseed(10)
+    for page, url in page_urls(fyyur).items():
+        with fyyur.profiler.assert_max_queries(small[page]):
+            response = client.get(url)
+        assert response.status_code == 200, url
@@ -0,0 +1,56 @@
+"""Read replica routing and the read-your-writes pin (see replicas.py).
+
+The "replica" is the test database reached through a second engine with
+its own application_name, so each request can tell which engine served
+it. Needs TEST_DATABASE_URL, see conftest.py.
+"""
+import time
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from replicas import PIN_COOKIE, ReplicaRouter, RoutingSQLAlchemy
+
+
+@pytest.fixture
+def client(fyyur):
+    url = make_url(fyyur.app.config['SQLALCHEMY_DATABASE_URI'])
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SQLALCHEMY_DATABASE_URI=str(url.update_query_dict({'application_name': 'primary'})),
+        SQLALCHEMY_REPLICA_URIS=[str(url.update_query_dict({'application_name': 'replica'}))],
+    )
+    ReplicaRouter(app)
+    db = RoutingSQLAlchemy(app)
+
+    @app.route('/source', methods=['GET', 'POST'])
+    def source():
+        # The engine that serves this request's queries.
+        return db.session.execute(text("SELECT current_setting('application_name')")).scalar()
+
+    yield app.test_client()
+    with app.app_context():
+        db.get_engine(app).dispose()
+        db.get_engine(app, 'replica0').dispose()
+
+
+def test_reads_go_to_a_replica(client):
+    assert client.get('/source').data == b'replica'
+
+
+def test_writes_go_to_the_primary_and_pin_the_client(client):
+    response = client.post('/source')
+    assert response.data == b'primary'
+    assert PIN_COOKIE in response.headers['Set-Cookie']
+
+    # The page a write redirects to reads the primary, so it shows the edit.
+    assert client.get('/source').data == b'primary'
+
+
+def test_pin_expires(client):
+    client.set_cookie('localhost', PIN_COOKIE, '{:.3f}'.format(time.time() - 1))
+    assert client.get('/source').data == b'replica'
@@ -0,0 +1,46 @@
+"""The per-request SQL profiler (see sqlprofiler.py): statement counts,
+N+1 detection and assert_max_queries. Needs TEST_DATABASE_URL, see
+conftest.py.
+"""
+import logging
+
+import pytest
+from sqlalchemy import text
+
+from sqlprofiler import normalize
+
+
+def test_normalize_gives_per_row_queries_one_shape():
+    assert normalize('SELECT * FROM "Show" WHERE venue_id = %(venue_id_1)s') == \
+        normalize('SELECT *\n  FROM "Show" WHERE venue_id = 42')
+    assert normalize('SELECT 1 WHERE id IN (?, ?, ?)') == 'SELECT ? WHERE id IN (?...)'
+
+
+def test_assert_max_queries(fyyur, db):
+    profiler = fyyur.profiler
+    with profiler.assert_max_queries(2) as recorder:
+        db.session.execute(text('SELECT 1'))
+        db.session.execute(text('SELECT 2'))
+    assert recorder.count == 2
+
+    with pytest.raises(AssertionError, match='3 queries executed, at most 2 expected'):
+        with profiler.assert_max_queries(2):
+            for value in range(3):
+                db.session.execute(text('SELECT :value'), {'value': value})
+
+
+def test_requests_are_counted_and_repeated_shapes_logged(fyyur, db, monkeypatch, caplog):
+    # Every shape a page sends counts as repeated at threshold 1.
+    monkeypatch.setitem(fyyur.app.config, 'SQL_NPLUS1_THRESHOLD', 1)
+    monkeypatch.setitem(fyyur.app.config, 'SQL_PROFILE_HEADERS', True)
+    client = fyyur.app.test_client()
+    # The first request loads the in-memory indexes outside the request's
+    # own recorder; keep it out of the comparison.
+    client.get('/')
+
+    with fyyur.profiler.record() as recorder:
+        with caplog.at_level(logging.WARNING, logger='fyyur.sql'):
+            response = client.get('/venues')
+    assert response.status_code == 200
+    assert response.headers['X-Query-Count'] == str(recorder.count)
+    assert 'Possible N+1 in GET /venues: 1 x SELECT' in caplog.text
@@ -0,0 +1,18 @@
+"""The /_stats/* endpoints share the import endpoint's bearer token. Needs
+TEST_DATABASE_URL, see conftest.py.
+"""
+import pytest
+
+STATS = ['/_stats/cache', '/_stats/typeahead', '/_stats/facets', '/_stats/matchmaking', '/_stats/jobs']
+
+
+@pytest.mark.parametrize('url', STATS)
+def test_stats_need_the_token(fyyur, monkeypatch, url):
+    client = fyyur.app.test_client()
+    monkeypatch.setitem(fyyur.app.config, 'IMPORT_TOKEN', None)
+    assert client.get(url).status_code == 404
+
+    monkeypatch.setitem(fyyur.app.config, 'IMPORT_TOKEN', 's3cret')
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get(url, headers={'Authorization': 'Bearer s3cret'}).status_code == 200
@@ -0,0 +1,221 @@
+import heapq
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from indexes import RebuildableIndex
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Typeahead index.
+#----------------------------------------------------------------------------#
+
+# An in-process prefix index over Venue.name and Artist.name for search as
+# you type. Every name is split into lowercase word tokens kept in one
+# sorted list per kind, so the entries for a prefix are a contiguous slice
+# found by bisection. A query matches names that have a token starting with
+# each of its words, e.g. "mus ho" finds "The Musical Hop".
+#
+# Results are ranked names starting with the query first, then shorter
+# names, then alphabetically. Entries are (token, len(name), lowercase
+# name, kind, id) tuples, so within one token they are already in rank
+# order: merging the runs of the tokens under a prefix yields candidates
+# best first, and a query stops as soon as it has enough matches instead of
+# reading the whole prefix range. Names starting with the query come from
+# a second list holding only each name's first token, merged the same way.
+#
+# The index is loaded and rebuilt like the other in-memory indexes (see
+# indexes.py); `flask rebuild-typeahead` touches its stamp file. Queries
+# never touch the database.
+#
+# Memory is bounded by max_names: names beyond it are not indexed and the
+# regular search pages still find them.
+
+logger = logging.getLogger('fyyur.typeahead')
+
+KINDS = {'venue': Venue, 'artist': Artist}
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokens(name):
+    return sorted(set(_TOKEN.findall(name.lower())))
+
+
+def _entries(kind, entity_id, name, name_tokens):
+    lowered = name.lower()
+    return [(token, len(name), lowered, kind, entity_id) for token in name_tokens]
+
+
+def _leading(kind, entity_id, name):
+    # The entry for the name's first token, or None for a name without one.
+    lowered = name.lower()
+    first = _TOKEN.match(lowered)
+    return (first.group(), len(name), lowered, kind, entity_id) if first else None
+
+
+def _rank(entry):
+    return entry[1:]
+
+
+class TypeaheadIndex(RebuildableIndex):
+    label = 'Typeahead index'
+
+    def __init__(self, max_names=500000, max_age=300, stamp_path=None):
+        RebuildableIndex.__init__(self, max_age, stamp_path, threading.RLock())
+        self.max_names = max_names
+        self._clear()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('TYPEAHEAD_MAX_NAMES', 500000),
+                   config.get('TYPEAHEAD_MAX_AGE', 300),
+                   config.get('TYPEAHEAD_STAMP'))
+
+    def _clear(self):
+        # _tokens[kind] and _leading[kind] are sorted entry lists for every
+        # token and for first tokens only; _names maps each (kind, id) key
+        # to its name and that name's tokens.
+        self._tokens = {kind: [] for kind in KINDS}
+        self._leading = {kind: [] for kind in KINDS}
+        self._names = {}
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._names)
+
+    def _insert(self, key, name):
+        kind, entity_id = key
+        name_tokens = tokens(name)
+        for entry in _entries(kind, entity_id, name, name_tokens):
+            insort(self._tokens[kind], entry)
+        leading = _leading(kind, entity_id, name)
+        if leading:
+            insort(self._leading[kind], leading)
+        self._names[key] = (name, name_tokens)
+
+    def _remove(self, key):
+        entry = self._names.pop(key, None)
+        if entry is None:
+            return
+        kind, entity_id = key
+        name, name_tokens = entry
+        for entries, removed in ((self._tokens[kind], _entries(kind, entity_id, name, name_tokens)),
+                                 (self._leading[kind], [_leading(kind, entity_id, name)])):
+            for item in removed:
+                if item is None:
+                    continue
+                index = bisect_left(entries, item)
+                if index < len(entries) and entries[index] == item:
+                    del entries[index]
+
+    def put(self, kind, entity_id, name):
+        # Add or rename one venue or artist.
+        key = (kind, entity_id)
+        with self._lock:
+            self._remove(key)
+            if len(self._names) < self.max_names:
+                self._insert(key, name)
+
+    def discard(self, kind, entity_id):
+        with self._lock:
+            self._remove((kind, entity_id))
+
+    def build(self):
+        # Load every name, sort once, and swap the new index in.
+        started = time.time()
+        entries = {kind: [] for kind in KINDS}
+        leading = {kind: [] for kind in KINDS}
+        names = {}
+        for kind, model in KINDS.items():
+            query = db.session.query(model.id, model.name).order_by(model.id) \
+                .limit(self.max_names - len(names))
+            for entity_id, name in query:
+                name_tokens = tokens(name)
+                names[(kind, entity_id)] = (name, name_tokens)
+                entries[kind].extend(_entries(kind, entity_id, name, name_tokens))
+                first = _leading(kind, entity_id, name)
+                if first:
+                    leading[kind].append(first)
+            entries[kind].sort()
+            leading[kind].sort()
+        with self._lock:
+            self._tokens = entries
+            self._leading = leading
+            self._names = names
+            self.built_at = started
+        logger.info('Typeahead index built: %d names, %d tokens in %.2fs',
+                    len(names), sum(map(len, entries.values())), time.time() - started)
+
+    @staticmethod
+    def _runs(entries, prefix):
+        # Iterators over the run of each token starting with prefix, found
+        # by bisection from one run to the next.
+        runs = []
+        index = bisect_left(entries, (prefix,))
+        while index < len(entries) and entries[index][0].startswith(prefix):
+            token = entries[index][0]
+            end = bisect_left(entries, (token + '\0',), index)
+            runs.append(entries[position] for position in range(index, end))
+            index = end
+        return runs
+
+    def _candidates(self, lists, prefix, kinds):
+        # Entries under prefix in every kind's list, best ranked first.
+        runs = []
+        for kind in kinds:
+            runs.extend(self._runs(lists[kind], prefix))
+        return heapq.merge(*runs, key=_rank)
+
+    def _width(self, word, kinds):
+        return sum(bisect_left(self._tokens[kind], (word + '\uffff',)) - bisect_left(self._tokens[kind], (word,))
+                   for kind in kinds)
+
+    def query(self, text, limit=DEFAULT_LIMIT, kinds=None):
+        # Up to limit (kind, id, name) matches: names starting with the
+        # query first, then shorter names, then alphabetically.
+        limit = max(1, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
+        words = tokens(text)
+        if not words:
+            return []
+        query = ' '.join(_TOKEN.findall(text.lower()))
+        kinds = [kind for kind in KINDS if not kinds or kind in kinds]
+        matches = []
+        with self._lock:
+            # A name starting with the query has a first token starting
+            # with the query's first word, and contains all its words.
+            seen = set()
+            for entry in self._candidates(self._leading, query.split(' ')[0], kinds):
+                if entry[2].startswith(query):
+                    matches.append(entry)
+                    seen.add(entry[3:])
+                    if len(matches) == limit:
+                        break
+            if len(matches) < limit:
+                # The rest: walk the narrowest word's prefix and check the
+                # other words against each candidate's full token set.
+                narrowest = min(words, key=lambda word: self._width(word, kinds))
+                others = [word for word in words if word != narrowest]
+                for entry in self._candidates(self._tokens, narrowest, kinds):
+                    key = entry[3:]
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    name_tokens = self._names[key][1]
+                    if all(any(token.startswith(word) for token in name_tokens) for word in others):
+                        matches.append(entry)
+                        if len(matches) == limit:
+                            break
+            return [(kind, entity_id, self._names[(kind, entity_id)][0])
+                    for _, _, _, kind, entity_id in matches]
+
+    def stats(self):
+        return {
+            'names': len(self._names),
+            'tokens': sum(map(len, self._tokens.values())),
+            'built_at': self.built_at,
+            'rebuilding': self._rebuilding,
+        }